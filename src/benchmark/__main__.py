@@ -0,0 +1,195 @@
+from asyncio import run
+from collections.abc import Callable
+from logging import getLogger
+from shutil import which
+from string import ascii_uppercase
+from time import perf_counter
+from typing import Any
+
+from pyogrio import read_info
+from pyogrio.errors import DataSourceError
+
+from src.config import (
+    BENCHMARK_ERROR_RATE,
+    BENCHMARK_ERROR_RECORDS,
+    BENCHMARK_LATENCY_MS,
+    BENCHMARK_LAYERS,
+    BENCHMARK_MAX_RECORD_COUNT,
+    boundaries_dir,
+    cwd,
+    tables_dir,
+)
+from src.download import httpx_async, ogr2ogr
+
+from .server import read_layer, start_server
+
+logger = getLogger(__name__)
+
+BYTES_PER_MB = 1_000_000
+SECONDS_PER_MINUTE = 60
+
+
+def get_service(number: int) -> str:
+    """Gets the name of a service served by the stand-in server.
+
+    Names are taken from the range "XAA" to "XZZ", which ISO 3166-1 reserves for user
+    assigned codes, so that files downloaded during a benchmark never overwrite the
+    files of a real country.
+
+    Args:
+        number: Number of the service, from 0.
+
+    Returns:
+        Three letter service name.
+    """
+    letters = len(ascii_uppercase)
+    first = ascii_uppercase[number // letters % letters]
+    second = ascii_uppercase[number % letters]
+    return f"X{first}{second}"
+
+
+def clean(metadata: list[dict[str, Any]]) -> None:
+    """Removes files downloaded during a benchmark.
+
+    Args:
+        metadata: List of rows of every layer in the benchmark.
+    """
+    for row in metadata:
+        filename = f"{row['iso3']}_adm{row['admin_level']}".lower()
+        for file in boundaries_dir.glob(f"{filename}.*"):
+            file.unlink(missing_ok=True)
+
+
+def verify(
+    metadata: list[dict[str, Any]],
+    layers: dict[str, dict[int, dict[str, Any]]],
+) -> None:
+    """Checks that every layer was saved with all of the features the server has.
+
+    Args:
+        metadata: List of rows of every layer in the benchmark.
+        layers: Layers served by the stand-in server, by service name and layer index.
+
+    Raises:
+        RuntimeError: Raises an error with the file names of layers which are missing
+        or have a different number of features than the server.
+    """
+    incomplete = []
+    for row in metadata:
+        filename = f"{row['iso3']}_adm{row['admin_level']}".lower()
+        features = len(layers[row["iso3"]][row["admin_level"]]["features"])
+        try:
+            saved = read_info(boundaries_dir / f"{filename}.gpkg")["features"]
+        except DataSourceError:
+            saved = None
+        if saved != features:
+            incomplete.append(filename)
+    if incomplete:
+        raise RuntimeError(", ".join(incomplete))
+
+
+def benchmark(
+    download_all: Callable[[list[dict[str, Any]]], Any],
+    metadata: list[dict[str, Any]],
+    layers: dict[str, dict[int, dict[str, Any]]],
+    options: dict[str, Any],
+) -> dict[str, Any]:
+    """Downloads every layer from the stand-in server with one backend.
+
+    Timing stops once the backend has finished, and before the saved layers are
+    verified against the server (see "verify"), so that a backend which drops features
+    fails the benchmark rather than reporting a faster result.
+
+    Args:
+        download_all: Function downloading a list of layers.
+        metadata: List of rows of every layer in the benchmark.
+        layers: Layers served by the stand-in server, by service name and layer index.
+        options: Options of the stand-in server from "start_server".
+
+    Returns:
+        Dict with the number of layers, requests, megabytes, seconds, layers per minute
+        and megabytes per second of the run.
+    """
+    clean(metadata)
+    requests, size = options["requests"], options["bytes"]
+    start = perf_counter()
+    download_all(metadata)
+    seconds = perf_counter() - start
+    verify(metadata, layers)
+    clean(metadata)
+    megabytes = (options["bytes"] - size) / BYTES_PER_MB
+    return {
+        "layers": len(metadata),
+        "requests": options["requests"] - requests,
+        "megabytes": megabytes,
+        "seconds": seconds,
+        "layers_per_minute": len(metadata) / seconds * SECONDS_PER_MINUTE,
+        "megabytes_per_second": megabytes / seconds,
+    }
+
+
+def main() -> None:
+    """Benchmarks download backends against a local stand-in ArcGIS server.
+
+    Serves the GeoPackages in "tests/test_data" as "BENCHMARK_LAYERS" layers, each in
+    its own service, from a local server with the latency, errors and maximum record
+    count set by the "BENCHMARK_*" variables. Every available backend downloads all
+    layers in turn, and the number of layers per minute and megabytes per second are
+    logged for each. The run fails if any backend saves a layer with a different number
+    of features than the server has. Files downloaded by the benchmark are removed
+    afterwards, and the download telemetry table of the last real run is kept.
+    """
+    logger.info("Starting")
+    files = sorted((cwd / "../tests/test_data").glob("*.gpkg"))
+    sources = [(int(x.stem.split("adm")[-1]), read_layer(x)) for x in files]
+    layers = {}
+    metadata = []
+    _, options = start_server(
+        layers,
+        latency=BENCHMARK_LATENCY_MS / 1000,
+        error_rate=BENCHMARK_ERROR_RATE,
+        error_records=BENCHMARK_ERROR_RECORDS,
+        max_record_count=BENCHMARK_MAX_RECORD_COUNT,
+    )
+    for number in range(BENCHMARK_LAYERS):
+        service = get_service(number)
+        lvl, layer = sources[number % len(sources)]
+        layers[service] = {lvl: layer}
+        metadata.append(
+            {
+                "iso3": service,
+                "admin_level": lvl,
+                "itos_url": f"{options['url']}/{service}/FeatureServer",
+                f"itos_index_{lvl}": lvl,
+            },
+        )
+    backends = {"httpx": lambda x: run(httpx_async.download_all(x))}
+    if which("ogr2ogr"):
+        backends["ogr2ogr"] = ogr2ogr.download_all
+    stats_file = tables_dir / "download_stats.csv"
+    stats = stats_file.read_bytes() if stats_file.is_file() else None
+    try:
+        for name, download_all in backends.items():
+            result = benchmark(download_all, metadata, layers, options)
+            logger.info(
+                "%s: %d layers, %d requests, %.1f MB in %.1f s, "
+                "%.1f layers/min, %.2f MB/s",
+                name,
+                result["layers"],
+                result["requests"],
+                result["megabytes"],
+                result["seconds"],
+                result["layers_per_minute"],
+                result["megabytes_per_second"],
+            )
+    finally:
+        clean(metadata)
+        if stats is not None:
+            stats_file.write_bytes(stats)
+        else:
+            stats_file.unlink(missing_ok=True)
+    logger.info("Finished")
+
+
+if __name__ == "__main__":
+    main()
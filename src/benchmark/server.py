@@ -0,0 +1,279 @@
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from pathlib import Path
+from re import IGNORECASE, compile
+from threading import Lock, Thread
+from time import sleep
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from geopandas import GeoDataFrame, read_file
+from pandas import isna
+from pandas.api.types import (
+    is_datetime64_any_dtype,
+    is_float_dtype,
+    is_integer_dtype,
+)
+from shapely import MultiPolygon, Polygon
+from shapely.geometry.polygon import orient
+
+from src.config import EPSG_WGS84
+
+LAYER_PATH = compile(
+    r"^/(?P<service>[^/]+)/FeatureServer/(?P<idx>\d+)(?P<query>/query)?$",
+)
+WHERE_BETWEEN = compile(r"^OBJECTID BETWEEN (\d+) AND (\d+)$", IGNORECASE)
+
+
+def get_fields(gdf: GeoDataFrame) -> list[dict[str, str]]:
+    """Describes the attributes of a layer as ESRI JSON fields.
+
+    Args:
+        gdf: Layer to describe.
+
+    Returns:
+        List of ESRI JSON fields, starting with the object ID.
+    """
+    fields = [{"name": "OBJECTID", "type": "esriFieldTypeOID"}]
+    for name, dtype in gdf.drop(columns="geometry").dtypes.items():
+        field_type = "esriFieldTypeString"
+        if is_datetime64_any_dtype(dtype):
+            field_type = "esriFieldTypeDate"
+        elif is_integer_dtype(dtype):
+            field_type = "esriFieldTypeInteger"
+        elif is_float_dtype(dtype):
+            field_type = "esriFieldTypeDouble"
+        fields.append({"name": str(name), "type": field_type})
+    return fields
+
+
+def get_value(value: object) -> object:
+    """Converts an attribute value to ESRI JSON.
+
+    Args:
+        value: Attribute value read with geopandas.
+
+    Returns:
+        Value which can be serialized as JSON. Dates are milliseconds since the UNIX
+        epoch, and missing values are null.
+    """
+    if isna(value):
+        return None
+    if hasattr(value, "timestamp"):
+        return int(value.timestamp() * 1000)
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def get_rings(geometry: Polygon | MultiPolygon) -> list[list[list[float]]]:
+    """Converts a polygon to ESRI JSON rings.
+
+    ESRI JSON outer rings are clockwise and holes are counter-clockwise.
+
+    Args:
+        geometry: Polygon or MultiPolygon.
+
+    Returns:
+        List of rings, each a list of coordinates.
+    """
+    polygons = geometry.geoms if isinstance(geometry, MultiPolygon) else [geometry]
+    rings = []
+    for polygon in polygons:
+        oriented = orient(polygon, sign=-1.0)
+        rings.append([list(x) for x in oriented.exterior.coords])
+        rings.extend([list(x) for x in ring.coords] for ring in oriented.interiors)
+    return rings
+
+
+def read_layer(file: Path) -> dict[str, Any]:
+    """Reads a GeoPackage into ESRI JSON features served by the stand-in server.
+
+    Multi-part features are split into one feature per part, so that small test layers
+    have enough records to paginate through.
+
+    Args:
+        file: Path of a GeoPackage.
+
+    Returns:
+        Dict with the fields, features, and date of last edit of the layer.
+    """
+    gdf = read_file(file).to_crs(EPSG_WGS84).explode(ignore_index=True)
+    columns = [x for x in gdf.columns if x != "geometry"]
+    features = [
+        {
+            "attributes": {
+                "OBJECTID": oid + 1,
+                **{x: get_value(row[x]) for x in columns},
+            },
+            "geometry": {"rings": get_rings(row["geometry"])},
+        }
+        for oid, row in enumerate(gdf.to_dict("records"))
+    ]
+    return {
+        "fields": get_fields(gdf),
+        "features": features,
+        "last_edit_date": int(file.stat().st_mtime * 1000),
+    }
+
+
+def query_layer(
+    layer: dict[str, Any],
+    query: dict[str, str],
+    options: dict[str, Any],
+) -> dict[str, Any]:
+    """Answers a query of a layer in the same way as an ArcGIS Feature Service.
+
+    Supports "where" with either "1=1" or a range of object IDs, "returnCountOnly",
+    "returnIdsOnly", and pagination with "resultOffset" and "resultRecordCount". At most
+    "max_record_count" features are returned, with "exceededTransferLimit" set if more
+    remain. Only ESRI JSON is supported, other formats return an error.
+
+    Args:
+        layer: Layer from "read_layer".
+        query: URL query parameters of the request.
+        options: Options of the server from "start_server".
+
+    Returns:
+        ESRI JSON response represented as a dict.
+    """
+    features = layer["features"]
+    between = WHERE_BETWEEN.match(query.get("where", "1=1"))
+    if between:
+        first, last = int(between[1]), int(between[2])
+        features = [x for x in features if first <= x["attributes"]["OBJECTID"] <= last]
+    if query.get("returnCountOnly", "").lower() == "true":
+        return {"count": len(features)}
+    if query.get("returnIdsOnly", "").lower() == "true":
+        object_ids = [x["attributes"]["OBJECTID"] for x in features]
+        return {"objectIdFieldName": "OBJECTID", "objectIds": object_ids}
+    records = int(query.get("resultRecordCount", options["max_record_count"]))
+    offset = int(query.get("resultOffset", 0))
+    error_records = options["error_records"]
+    with options["lock"]:
+        options["queries"] += 1
+        queries = options["queries"]
+    error_rate = options["error_rate"]
+    is_error = queries * error_rate // 100 != (queries - 1) * error_rate // 100
+    selected = features[offset : offset + min(records, options["max_record_count"])]
+    is_large = len(selected) > 1 and any(
+        x["attributes"]["OBJECTID"] in options["error_ids"] for x in selected
+    )
+    is_large = is_large or 0 < error_records < len(selected)
+    if query.get("f") != "json" or is_error or is_large:
+        return {"error": {"code": 500, "message": "Error performing query operation"}}
+    result = {
+        "objectIdFieldName": "OBJECTID",
+        "geometryType": "esriGeometryPolygon",
+        "spatialReference": {"wkid": EPSG_WGS84},
+        "fields": layer["fields"],
+        "features": selected,
+    }
+    if offset + len(selected) < len(features):
+        result["exceededTransferLimit"] = True
+    return result
+
+
+def get_response(
+    layers: dict[str, dict[int, dict[str, Any]]],
+    path: str,
+    options: dict[str, Any],
+) -> dict[str, Any] | None:
+    """Answers a request for a layer description or a layer query.
+
+    Args:
+        layers: Layers from "read_layer", by service name and layer index.
+        path: Path and query of the request.
+        options: Options of the server from "start_server".
+
+    Returns:
+        ESRI JSON response represented as a dict, or None if the layer is not found.
+    """
+    url = urlparse(path)
+    match = LAYER_PATH.match(url.path)
+    if not match:
+        return None
+    layer = layers.get(match["service"], {}).get(int(match["idx"]))
+    if layer is None:
+        return None
+    if match["query"]:
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return query_layer(layer, query, options)
+    return {
+        "id": int(match["idx"]),
+        "type": "Feature Layer",
+        "maxRecordCount": options["max_record_count"],
+        "supportedQueryFormats": "JSON",
+        "editingInfo": {"lastEditDate": layer["last_edit_date"]},
+    }
+
+
+def start_server(  # noqa: PLR0913
+    layers: dict[str, dict[int, dict[str, Any]]],
+    latency: float = 0,
+    error_rate: float = 0,
+    error_records: int = 0,
+    max_record_count: int = 2000,
+    error_ids: set[int] | None = None,
+) -> tuple[ThreadingHTTPServer, dict[str, Any]]:
+    """Starts a local stand-in for an ArcGIS Feature Service in a background thread.
+
+    Layers are served at "/{service}/FeatureServer/{idx}", in the same way as the ITOS
+    server. Errors are returned as ESRI JSON with a status of 200, as ArcGIS does.
+
+    Args:
+        layers: Layers from "read_layer", by service name and layer index.
+        latency: Seconds to wait before answering each request.
+        error_rate: Percentage of queries answered with an error, spread evenly across
+        queries so that runs are repeatable.
+        error_records: Queries selecting more than this number of features are answered
+        with an error, as servers do for layers with very large geometries. 0 to
+        disable.
+        max_record_count: Maximum number of features returned by a query.
+        error_ids: Object IDs of features with very large geometries. Queries which
+        select one of them along with other features are answered with an error.
+
+    Returns:
+        The running server, and its options including the number of "requests" and
+        "bytes" sent so far. The base URL of the server is in "url".
+    """
+    options = {
+        "error_rate": error_rate,
+        "error_records": error_records,
+        "max_record_count": max_record_count,
+        "error_ids": error_ids or set(),
+        "lock": Lock(),
+        "queries": 0,
+        "requests": 0,
+        "bytes": 0,
+    }
+
+    def do_get(handler: BaseHTTPRequestHandler) -> None:
+        sleep(latency)
+        response = get_response(layers, handler.path, options)
+        status = HTTPStatus.OK if response is not None else HTTPStatus.NOT_FOUND
+        body = dumps(response, separators=(",", ":")).encode()
+        with options["lock"]:
+            options["requests"] += 1
+            options["bytes"] += len(body)
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    handler = type(
+        "Handler",
+        (BaseHTTPRequestHandler,),
+        {
+            "protocol_version": "HTTP/1.1",
+            "do_GET": do_get,
+            "log_message": lambda *_: None,
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    options["url"] = f"http://127.0.0.1:{server.server_port}"
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, options
@@ -0,0 +1,379 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import sha256
+from http import HTTPStatus
+from json import dumps, load
+from os import utime
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import time
+from typing import Any
+
+from httpx import URL, Request, Response
+
+from .config import (
+    HTTP_CACHE,
+    HTTP_CACHE_OFFLINE,
+    HTTP_CACHE_SIZE_MB,
+    HTTP_CACHE_TTL,
+    cache_dir,
+)
+from .download.httpx import is_error
+
+BYTES_PER_MB = 1_000_000
+CACHED_HEADERS = ["content-type", "etag", "last-modified"]
+
+bypass: ContextVar[bool] = ContextVar("bypass", default=False)
+version: ContextVar[int | None] = ContextVar("version", default=None)
+lock = Lock()
+size: dict[str, int] = {}
+
+
+def is_enabled() -> bool:
+    """Checks whether responses are read from and saved to the cache.
+
+    Returns:
+        True if the offline mode is turned on, or if the cache is turned on and not
+        bypassed in the current context (see "bypassed").
+    """
+    return HTTP_CACHE_OFFLINE or (HTTP_CACHE and not bypass.get())
+
+
+@contextmanager
+def bypassed() -> Iterator[None]:
+    """Sends requests made in the current context straight to the server.
+
+    Used for requests whose answer must always be current, such as the state of a
+    layer used to decide whether it has changed, and for large responses which would
+    only fill the cache. Tasks and threads started from the context are bypassed too.
+    Offline, every request is still answered from the cache, as there is no server.
+
+    Yields:
+        Nothing, requests are bypassed until the context exits.
+    """
+    token = bypass.set(True)
+    try:
+        yield
+    finally:
+        bypass.reset(token)
+
+
+@contextmanager
+def versioned(value: int | None) -> Iterator[None]:
+    """Keys requests made in the current context by the version of the data they read.
+
+    Used for queries of a layer, with its date of last edit, so that a response cached
+    before the layer was edited is never reused afterwards, even while it is still
+    fresh. Tasks and threads started from the context are versioned too. Without a
+    version, responses are only kept for "HTTP_CACHE_TTL" seconds as usual.
+
+    Args:
+        value: Version of the data, or None if it is not known.
+
+    Yields:
+        Nothing, requests are versioned until the context exits.
+    """
+    token = version.set(value)
+    try:
+        yield
+    finally:
+        version.reset(token)
+
+
+def get_key(url: str, params: dict | None = None) -> str:
+    """Gets the key of a request in the cache.
+
+    Query parameters are sorted, so that the same request always has the same key
+    regardless of the order its parameters were given in. Requests made in a versioned
+    context (see "versioned") include the version in their key.
+
+    Args:
+        url: A valid URL.
+        params: Optional URL query parameters included in the request.
+
+    Returns:
+        Hex digest identifying the request.
+    """
+    query = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    request = [url, query] if version.get() is None else [url, query, version.get()]
+    return sha256(dumps(request).encode()).hexdigest()
+
+
+def get_files(key: str) -> tuple[Path, Path]:
+    """Gets the files of a cached response.
+
+    Args:
+        key: Key of the request from "get_key".
+
+    Returns:
+        Paths of the metadata file and of the body of the response.
+    """
+    return cache_dir / f"{key}.json", cache_dir / f"{key}.body"
+
+
+def load_response(key: str) -> dict[str, Any] | None:
+    """Loads a response from the cache, marking it as recently used.
+
+    Args:
+        key: Key of the request from "get_key".
+
+    Returns:
+        Dict with the URL, status, headers, time it was saved and body of the response,
+        or None if it is not in the cache.
+    """
+    meta_file, body_file = get_files(key)
+    try:
+        with Path.open(meta_file) as f:
+            entry = load(f)
+        entry["content"] = body_file.read_bytes()
+        utime(meta_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    return entry
+
+
+def write_file(file: Path, content: bytes) -> None:
+    """Writes a file of the cache through a temporary file, replacing it at once.
+
+    The same request may be saved by several threads at the same time, so every write
+    has its own uniquely named temporary file, and the last one to finish wins.
+
+    Args:
+        file: Path of the metadata file or body of a response.
+        content: Content of the file.
+    """
+    with NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as f:
+        f.write(content)
+    Path(f.name).replace(file)
+
+
+def save_response(key: str, response: Response) -> None:
+    """Saves a response to the cache, evicting the least recently used if it is full.
+
+    The body is written before the metadata, and each through a temporary file, so that
+    a response is never read back half written.
+
+    Args:
+        key: Key of the request from "get_key".
+        response: HTTP response whose body has been read.
+    """
+    meta_file, body_file = get_files(key)
+    entry = {
+        "url": str(response.request.url),
+        "status": response.status_code,
+        "headers": {
+            x: response.headers[x] for x in CACHED_HEADERS if x in response.headers
+        },
+        "saved": time(),
+    }
+    previous = get_size(meta_file, body_file)
+    write_file(body_file, response.content)
+    write_file(meta_file, dumps(entry).encode())
+    add_size(get_size(meta_file, body_file) - previous)
+
+
+def touch_response(key: str, entry: dict[str, Any]) -> None:
+    """Marks a cached response as fresh again, after the server confirmed it unchanged.
+
+    Args:
+        key: Key of the request from "get_key".
+        entry: Cached response from "load_response".
+    """
+    meta_file, _ = get_files(key)
+    entry = {k: v for k, v in entry.items() if k != "content"}
+    entry["saved"] = time()
+    write_file(meta_file, dumps(entry).encode())
+
+
+def get_size(meta_file: Path, body_file: Path) -> int:
+    """Gets the size of a cached response on disk.
+
+    Args:
+        meta_file: Path of the metadata file of the response.
+        body_file: Path of the body of the response.
+
+    Returns:
+        Size in bytes of both files, or 0 if the response is not in the cache.
+    """
+    try:
+        return meta_file.stat().st_size + body_file.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def add_size(change: int) -> None:
+    """Keeps a running total of the size of the cache, evicting responses if needed.
+
+    The cache directory is only scanned the first time a response is saved, and again
+    when the total grows past "HTTP_CACHE_SIZE_MB", so that saving a response does not
+    cost a scan of every response already in the cache.
+
+    Args:
+        change: Number of bytes added to the cache by the last response saved.
+    """
+    with lock:
+        if "bytes" not in size:
+            size["bytes"] = sum(
+                get_size(x, x.with_suffix(".body")) for x in cache_dir.glob("*.json")
+            )
+        else:
+            size["bytes"] += change
+        if size["bytes"] > HTTP_CACHE_SIZE_MB * BYTES_PER_MB:
+            evict()
+
+
+def evict() -> None:
+    """Removes the least recently used responses until the cache fits its size limit.
+
+    Must be called while holding "lock". The total size of the cache is measured again
+    from disk, correcting any drift in the running total.
+    """
+    entries = []
+    for meta_file in cache_dir.glob("*.json"):
+        body_file = meta_file.with_suffix(".body")
+        try:
+            used = meta_file.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        entries.append((used, get_size(meta_file, body_file), meta_file, body_file))
+    total = sum(x[1] for x in entries)
+    for _, entry_size, meta_file, body_file in sorted(entries, key=lambda x: x[0]):
+        if total <= HTTP_CACHE_SIZE_MB * BYTES_PER_MB:
+            break
+        meta_file.unlink(missing_ok=True)
+        body_file.unlink(missing_ok=True)
+        total -= entry_size
+    size["bytes"] = total
+
+
+def is_fresh(entry: dict[str, Any]) -> bool:
+    """Checks whether a cached response can be used without asking the server.
+
+    Args:
+        entry: Cached response from "load_response".
+
+    Returns:
+        True if offline, or if the response was saved less than "HTTP_CACHE_TTL"
+        seconds ago.
+    """
+    return HTTP_CACHE_OFFLINE or time() - entry["saved"] < HTTP_CACHE_TTL
+
+
+def is_cacheable(response: Response) -> bool:
+    """Checks whether a response can be saved to the cache.
+
+    ArcGIS servers answer failed queries with a status of 200 and an error in the
+    body, which would otherwise be replayed until it expires. Errors are detected in the
+    same way as while paging through a layer (see "src.download.httpx.is_error").
+
+    Args:
+        response: HTTP response whose body has been read.
+
+    Returns:
+        True if the response was successful.
+    """
+    return response.is_success and not is_error(response.content)
+
+
+def get_headers(entry: dict[str, Any] | None) -> dict[str, str]:
+    """Gets the headers revalidating a stale cached response with the server.
+
+    Args:
+        entry: Cached response from "load_response", or None if not cached.
+
+    Returns:
+        Conditional request headers, empty if the server gave no validators.
+    """
+    if entry is None:
+        return {}
+    headers = {}
+    if "etag" in entry["headers"]:
+        headers["If-None-Match"] = entry["headers"]["etag"]
+    if "last-modified" in entry["headers"]:
+        headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+    return headers
+
+
+def to_response(entry: dict[str, Any]) -> Response:
+    """Converts a cached response back into an HTTP response.
+
+    Args:
+        entry: Cached response from "load_response".
+
+    Returns:
+        HTTP response with the status, headers and body that were cached.
+    """
+    return Response(
+        entry["status"],
+        headers=entry["headers"],
+        content=entry["content"],
+        request=Request("GET", entry["url"]),
+    )
+
+
+def get_miss(url: str, params: dict | None = None) -> FileNotFoundError:
+    """Gets the error raised for a request missing from the cache while offline.
+
+    Args:
+        url: A valid URL.
+        params: Optional URL query parameters included in the request.
+
+    Returns:
+        Error naming the request and the offline mode, so that a missing response is
+        not mistaken for an empty or invalid one.
+    """
+    request = URL(url, params=params)
+    return FileNotFoundError(f"Not in the HTTP cache while offline: {request}")
+
+
+def get_cached(
+    url: str,
+    params: dict | None = None,
+) -> tuple[str, dict[str, Any] | None, Response | None]:
+    """Looks up a request in the cache before it is sent.
+
+    Args:
+        url: A valid URL.
+        params: Optional URL query parameters included in the request.
+
+    Returns:
+        Key of the request, cached response if any, and the response to use instead of
+        sending the request, if the cached response is fresh or the cache is offline.
+
+    Raises:
+        FileNotFoundError: Raises an error if the cache is offline and the request has
+        not been cached.
+    """
+    if not is_enabled():
+        return "", None, None
+    key = get_key(url, params)
+    entry = load_response(key)
+    if entry is not None and is_fresh(entry):
+        return key, entry, to_response(entry)
+    if HTTP_CACHE_OFFLINE:
+        raise get_miss(url, params)
+    return key, entry, None
+
+
+def update(key: str, entry: dict[str, Any] | None, response: Response) -> Response:
+    """Updates the cache with the response of the server to a request.
+
+    Args:
+        key: Key of the request from "get_key".
+        entry: Cached response from "load_response", or None if not cached.
+        response: HTTP response from the server, whose body has been read.
+
+    Returns:
+        The cached response if the server confirmed it is unchanged, otherwise the
+        response from the server.
+    """
+    if not is_enabled():
+        return response
+    if entry is not None and response.status_code == HTTPStatus.NOT_MODIFIED:
+        touch_response(key, entry)
+        return to_response(entry)
+    if is_cacheable(response):
+        save_response(key, response)
+    return response
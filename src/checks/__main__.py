@@ -1,5 +1,11 @@
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from logging import getLogger
 from multiprocessing import Pool
+from pathlib import Path
+from types import ModuleType
 from typing import Any
 
 from geopandas import GeoDataFrame, read_file
@@ -7,7 +13,16 @@ from pandas import DataFrame
 from pyogrio.errors import DataSourceError
 from tqdm import tqdm
 
-from src.config import MULTIPROCESSING, boundaries_dir, tables_dir
+from src.config import (
+    CHECKS_LAYER_CACHE,
+    CHECKS_MAX_PENDING,
+    CHECKS_PREFETCH,
+    CHECKS_PREFETCH_MB,
+    MULTIPROCESSING,
+    CheckReturnList,
+    boundaries_dir,
+    tables_dir,
+)
 from src.utils import get_checks_filter, get_metadata
 
 from . import (
@@ -24,8 +39,13 @@ from . import (
 
 logger = getLogger(__name__)
 
+BYTES_PER_MB = 1_000_000
+
+# NOTE: Checks comparing a layer with its parent layer are registered here.
+PARENT_CHECKS = [geometry_within_parent, languages]
+
 
-def filter_checks(checks: list[Any]) -> list[Any]:
+def filter_checks(checks: list[ModuleType]) -> list[ModuleType]:
     """Filters checks performed by environment variable or argparser.
 
     Args:
@@ -36,26 +56,219 @@ def filter_checks(checks: list[Any]) -> list[Any]:
     """
     checks_include, checks_exclude = get_checks_filter()
     if checks_include:
-        checks = [x for x in checks if x[0].__name__.split(".")[-1] in checks_include]
+        checks = [x for x in checks if x.__name__.split(".")[-1] in checks_include]
     if checks_exclude:
-        checks = [
-            x for x in checks if x[0].__name__.split(".")[-1] not in checks_exclude
-        ]
+        checks = [x for x in checks if x.__name__.split(".")[-1] not in checks_exclude]
     return checks
 
 
-def create_output(checks: list) -> None:
+def get_levels(row: dict[str, Any]) -> int:
+    """Gets the highest admin level of a location.
+
+    Args:
+        row: Metadata of the location.
+
+    Returns:
+        Highest admin level, -1 if the location has none.
+    """
+    levels = row["itos_level"]
+    if levels is None:
+        levels = -1
+    return levels
+
+
+def get_layer_file(iso3: str, level: int) -> Path:
+    """Gets the file of an admin level of a location.
+
+    Args:
+        iso3: ISO3 code of the location.
+        level: Admin level.
+
+    Returns:
+        Path of the GeoPackage.
+    """
+    return boundaries_dir / f"{iso3.lower()}_adm{level}.gpkg"
+
+
+def load_layer(iso3: str, level: int) -> GeoDataFrame:
+    """Reads an admin level of a location from disk.
+
+    Args:
+        iso3: ISO3 code of the location.
+        level: Admin level to read.
+
+    Returns:
+        GeoDataFrame of the admin level, empty if it could not be read.
+    """
+    try:
+        return read_file(get_layer_file(iso3, level), use_arrow=True)
+    except DataSourceError:
+        return GeoDataFrame()
+
+
+@lru_cache(maxsize=CHECKS_LAYER_CACHE)
+def read_layer(iso3: str, level: int) -> GeoDataFrame:
+    """Reads an admin level of a location, keeping recently read layers in memory.
+
+    Each worker process has its own cache, so a layer is read from disk once per
+    worker rather than sent to every task. Checks must not modify the layers they
+    are given.
+
+    Args:
+        iso3: ISO3 code of the location.
+        level: Admin level to read.
+
+    Returns:
+        GeoDataFrame of the admin level, empty if it could not be read.
+    """
+    return load_layer(iso3, level)
+
+
+def load_layers(row: dict[str, Any]) -> dict[int, GeoDataFrame]:
+    """Reads every admin level of a location from disk.
+
+    Args:
+        row: Metadata of the location.
+
+    Returns:
+        Dict of GeoDataFrames by admin level.
+    """
+    return {x: load_layer(row["iso3"], x) for x in range(get_levels(row) + 1)}
+
+
+def get_size(row: dict[str, Any]) -> int:
+    """Gets the size on disk of every admin level of a location.
+
+    Args:
+        row: Metadata of the location.
+
+    Returns:
+        Size in bytes, used as an estimate of the memory needed to hold its layers.
+    """
+    files = [get_layer_file(row["iso3"], x) for x in range(get_levels(row) + 1)]
+    return sum(x.stat().st_size for x in files if x.is_file())
+
+
+def prefetch_layers(
+    metadata: list[dict[str, Any]],
+) -> Iterator[tuple[dict[str, Any], dict[int, GeoDataFrame]]]:
+    """Reads the layers of upcoming locations in a background thread.
+
+    While the current location is being checked, the layers of up to "CHECKS_PREFETCH"
+    following locations are read ahead, as long as their combined size on disk stays
+    below "CHECKS_PREFETCH_MB". The next location is always read, even if it is larger
+    than the limit on its own.
+
+    Only used without multiprocessing. Layers read ahead by the main process would
+    have to be pickled to reach a worker, so with multiprocessing each worker reads
+    the layers of its own tasks instead, while the other workers keep checking.
+
+    Args:
+        metadata: List of locations to check.
+
+    Yields:
+        Each location in order, with a dict of its GeoDataFrames by admin level.
+    """
+    queue: deque = deque()
+    queued = 0
+    rows = iter(metadata)
+    row = next(rows, None)
+    with ThreadPoolExecutor(1) as executor:
+        while row is not None or queue:
+            while row is not None and len(queue) <= CHECKS_PREFETCH:
+                size = get_size(row)
+                if queue and queued + size > CHECKS_PREFETCH_MB * BYTES_PER_MB:
+                    break
+                queue.append((row, executor.submit(load_layers, row), size))
+                queued += size
+                row = next(rows, None)
+            current, future, size = queue.popleft()
+            queued -= size
+            yield current, future.result()
+
+
+def get_task_levels(check: ModuleType, level: int) -> list[int]:
+    """Gets the admin levels a check needs to read to check a single admin level.
+
+    Args:
+        check: Module of the check.
+        level: Admin level being checked.
+
+    Returns:
+        The admin level being checked, and its parent for checks which need it.
+    """
+    if check in PARENT_CHECKS and level > 0:
+        return [level - 1, level]
+    return [level]
+
+
+def run_check(
+    function: Callable[[str, list[GeoDataFrame]], CheckReturnList],
+    iso3: str,
+    level: int,
+    levels: list[int],
+    layers: dict[int, GeoDataFrame] | None = None,
+) -> CheckReturnList:
+    """Runs a check on a single admin level of a location.
+
+    Tasks only carry the location and admin levels, and layers are read by the worker
+    running them, unless they were already read ahead. Checks take a list of every
+    admin level, so the levels which are not needed are left empty.
+
+    Args:
+        function: Main function of the check.
+        iso3: ISO3 code of the location.
+        level: Admin level being checked.
+        levels: Admin levels from "get_task_levels".
+        layers: Optional GeoDataFrames by admin level, from "prefetch_layers".
+
+    Returns:
+        List of check rows for the admin level being checked.
+    """
+    if layers is None:
+        layers = {x: read_layer(iso3, x) for x in levels}
+    gdfs = [layers[x] if x in levels else GeoDataFrame() for x in range(level + 1)]
+    return [row for row in function(iso3, gdfs) if row["level"] == level]
+
+
+def run_checks(
+    tasks: list[tuple[Callable[[str, list[GeoDataFrame]], CheckReturnList], list[int]]],
+    iso3: str,
+    level: int,
+    layers: dict[int, GeoDataFrame] | None = None,
+) -> list[CheckReturnList]:
+    """Runs every check on a single admin level of a location.
+
+    Running every check of an admin level in the same task gives them the same
+    GeoDataFrames, so values derived from a layer by "src.checks.geometry_cache" are
+    computed once and shared by every check rather than once per check.
+
+    Args:
+        tasks: Main function of each check, with its levels from "get_task_levels".
+        iso3: ISO3 code of the location.
+        level: Admin level being checked.
+        layers: Optional GeoDataFrames by admin level, from "prefetch_layers".
+
+    Returns:
+        List of check rows for the admin level being checked, for each check in order.
+    """
+    return [
+        run_check(function, iso3, level, levels, layers) for function, levels in tasks
+    ]
+
+
+def create_output(checks: list[ModuleType], results: list) -> None:
     """Create CSV from registered checks.
 
     Args:
         checks: Registered checks.
+        results: Results of "run_checks" for every admin level of every location.
     """
+    if MULTIPROCESSING:
+        results = [result.get() for result in results]
     output = None
-    for _, results in checks:
-        if MULTIPROCESSING:
-            rows = [row for result in results for row in result.get()]
-        else:
-            rows = [row for result in results for row in result]
+    for index, _ in enumerate(checks):
+        rows = [row for result in results for row in result[index]]
         partial = DataFrame(rows).convert_dtypes()
         if output is None:
             output = partial
@@ -69,17 +282,20 @@ def create_output(checks: list) -> None:
 def main() -> None:
     """Summarizes and describes the data contained within downloaded boundaries.
 
-    1. Create an iterable with each item containing the following (check_function,
-    results_list).
+    1. Create a list of checks to perform.
 
-    2. Iterate through ISO3 values, creating a list of GeoDataFrames containing admin
-    levels 0-n.
+    2. Iterate through ISO3 values and their admin levels 0-n. Without
+    multiprocessing, the layers of the next ISO3 values are read in the background
+    while the current one is checked. With multiprocessing, layers are not read
+    ahead, as reading the layers of one task overlaps with other workers checking.
 
-    3. Iterate through the check functions, passing to them the results list for that
-    check as well as boundary data needed for checking.
+    3. For each admin level, submit a single task running every check to a pool of
+    workers shared by every ISO3, so that checks of the same layer share the values
+    they derive from it. Tasks only carry the ISO3 and the admin levels the checks
+    need, which each worker reads itself and keeps in a small cache.
 
-    4. When all checks have run against the ISO3's GeoDataFrames, they are released from
-    memory and a new ISO3 is loaded in.
+    4. At most "CHECKS_MAX_PENDING" tasks are waiting at any time, so tasks of the next
+    ISO3 are queued while workers are still busy with the previous ones.
 
     5. After all the checks have been performed for all ISO3 values, join the check
     tables together by ISO3 and admin level.
@@ -90,46 +306,41 @@ def main() -> None:
 
     # NOTE: Register checks here.
     checks = [
-        (geometry_valid, []),
-        (geometry_gaps, []),
-        (geometry_overlaps_self, []),
-        (geometry_within_parent, []),
-        (table_pcodes, []),
-        (table_names, []),
-        (dates, []),
-        (languages, []),
-        (table_other, []),
+        geometry_valid,
+        geometry_gaps,
+        geometry_overlaps_self,
+        geometry_within_parent,
+        table_pcodes,
+        table_names,
+        dates,
+        languages,
+        table_other,
     ]
 
     checks = filter_checks(checks)
     metadata = get_metadata()
-    pbar = tqdm(metadata)
-    for row in pbar:
+    pool = Pool() if MULTIPROCESSING else None
+    results = []
+    pending: deque = deque()
+    rows = prefetch_layers(metadata) if pool is None else ((x, None) for x in metadata)
+    pbar = tqdm(rows, total=len(metadata))
+    for row, layers in pbar:
         pbar.set_postfix_str(row["iso3"])
         iso3 = row["iso3"]
-        levels = row["itos_level"]
-        if levels is None:
-            levels = -1
-        gdfs = []
-        for level in range(levels + 1):
-            file = boundaries_dir / f"{iso3.lower()}_adm{level}.gpkg"
-            try:
-                gdf = read_file(file, use_arrow=True)
-            except DataSourceError:
-                gdf = GeoDataFrame()
-            gdfs.append(gdf)
-        if MULTIPROCESSING:
-            with Pool() as pool:
-                for function, results in checks:
-                    result = pool.apply_async(function.main, args=[iso3, gdfs])
-                    results.append(result)
-                pool.close()
-                pool.join()
-        else:
-            for function, results in checks:
-                result = function.main(iso3, gdfs)
-                results.append(result)
-    create_output(checks)
+        for level in range(get_levels(row) + 1):
+            tasks = [(x.main, get_task_levels(x, level)) for x in checks]
+            if pool is None:
+                results.append(run_checks(tasks, iso3, level, layers))
+                continue
+            result = pool.apply_async(run_checks, args=[tasks, iso3, level])
+            results.append(result)
+            pending.append(result)
+            while len(pending) > CHECKS_MAX_PENDING:
+                pending.popleft().wait()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    create_output(checks, results)
     logger.info("Finished")
 
 
@@ -0,0 +1,239 @@
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from re import compile
+from typing import Any
+from weakref import finalize
+
+from geopandas import GeoDataFrame, GeoSeries
+from numpy import (
+    arange,
+    argsort,
+    array,
+    array_split,
+    asarray,
+    concatenate,
+    ndarray,
+    setdiff1d,
+    zeros,
+)
+from pandas import Series
+from shapely import coverage_invalid_edges, coverage_union_all, is_empty, union_all
+from shapely.geometry.base import BaseGeometry
+
+from src.config import (
+    CHECKS_THREADS,
+    DISSOLVE_GROUPS,
+    EPSG_WGS84,
+    POLYGON,
+    VALID_GEOMETRY,
+)
+
+PCODE_COLUMN = compile(r"^ADM\d_PCODE$")
+
+artifacts: dict[int, dict[str, Any]] = {}
+artifact_stats: Counter[str] = Counter()
+
+
+def get_artifact[T](
+    gdf: GeoDataFrame,
+    name: str,
+    function: Callable[[GeoDataFrame], T],
+) -> T:
+    """Gets a value derived from a layer, computing it only the first time.
+
+    Values are kept for as long as the layer itself, so every check given the same
+    layer in a process shares them. Checks must not modify the values they are given.
+    Values computed and reused are counted in "artifact_stats" as misses and hits.
+
+    Args:
+        gdf: Layer the value is derived from.
+        name: Name of the value.
+        function: Function computing the value from the layer.
+
+    Returns:
+        The value derived from the layer.
+    """
+    key = id(gdf)
+    if key not in artifacts:
+        artifacts[key] = {}
+        finalize(gdf, artifacts.pop, key, None)
+    cache = artifacts[key]
+    if name in cache:
+        artifact_stats["hits"] += 1
+    else:
+        artifact_stats["misses"] += 1
+        cache[name] = function(gdf)
+    return cache[name]
+
+
+def get_valid_reasons(gdf: GeoDataFrame) -> Series:
+    """Gets the reason each geometry of a layer is valid or invalid.
+
+    Args:
+        gdf: Layer to validate.
+
+    Returns:
+        Series of reasons, "Valid Geometry" for valid geometries.
+    """
+    return get_artifact(gdf, "valid_reasons", lambda x: x.geometry.is_valid_reason())
+
+
+def get_valid_geometry(gdf: GeoDataFrame) -> GeoSeries:
+    """Gets the geometry of a layer with invalid geometries made valid.
+
+    Args:
+        gdf: Layer to make valid.
+
+    Returns:
+        GeoSeries of valid geometries.
+    """
+    return get_artifact(gdf, "valid_geometry", lambda x: x.geometry.make_valid())
+
+
+def get_invalid_edges(gdf: GeoDataFrame) -> ndarray | None:
+    """Finds the geometries of a layer whose edges break it as a polygonal coverage.
+
+    In a valid coverage, every geometry is a valid polygon, no two polygons overlap,
+    and neighbours share the same vertices along their common edges. Validating a
+    coverage finds the invalid edges of every geometry in a single near-linear pass
+    over its shared-edge structure, from which both overlaps and gaps are derived: of
+    two overlapping polygons, at least one has invalid edges, and the gaps of a valid
+    coverage are the holes of a coverage union, which only needs to drop shared edges
+    rather than compute a full overlay.
+
+    Args:
+        gdf: Layer to validate.
+
+    Returns:
+        Array with True for each geometry with invalid edges, and False for other
+        geometries, including missing and empty ones. None if the layer cannot be
+        validated, as not all its geometries are valid polygons.
+    """
+
+    def validate(x: GeoDataFrame) -> ndarray | None:
+        is_present = (x.geometry.notna() & ~x.geometry.is_empty).to_numpy()
+        geometry = x.geometry[is_present]
+        if not geometry.geom_type.str.contains(POLYGON).all():
+            return None
+        if not get_valid_reasons(x)[is_present].eq(VALID_GEOMETRY).all():
+            return None
+        edges = coverage_invalid_edges(asarray(geometry.array))
+        is_invalid = zeros(len(x), dtype=bool)
+        is_invalid[is_present] = ~is_empty(edges)
+        return is_invalid
+
+    return get_artifact(gdf, "invalid_edges", validate)
+
+
+def is_coverage(gdf: GeoDataFrame) -> bool:
+    """Checks whether a layer is a valid polygonal coverage.
+
+    Args:
+        gdf: Layer to validate.
+
+    Returns:
+        True if the layer is a valid coverage (see "get_invalid_edges").
+    """
+    is_invalid = get_invalid_edges(gdf)
+    return is_invalid is not None and not is_invalid.any()
+
+
+def get_groups(gdf: GeoDataFrame) -> list[ndarray]:
+    """Splits the geometries of a layer into groups of neighbours to dissolve.
+
+    Geometries are grouped by the P-code of their parent where the layer has one.
+    Otherwise, they are sorted along a Hilbert curve, which keeps neighbours close
+    together, and split into "CHECKS_THREADS" times "DISSOLVE_GROUPS" groups.
+
+    Args:
+        gdf: Layer to dissolve.
+
+    Returns:
+        List of arrays of positions of geometries in the layer.
+    """
+    pcodes = sorted(x for x in gdf.columns if PCODE_COLUMN.match(str(x)))
+    if len(pcodes) > 1:
+        return list(gdf.reset_index(drop=True).groupby(pcodes[-2]).indices.values())
+    geometry = gdf.geometry.reset_index(drop=True)
+    geometry = geometry[~geometry.is_empty & geometry.notna()]
+    if geometry.empty:
+        return []
+    order = geometry.index.to_numpy()[argsort(geometry.hilbert_distance().to_numpy())]
+    return array_split(order, CHECKS_THREADS * DISSOLVE_GROUPS)
+
+
+def dissolve(gdf: GeoDataFrame) -> BaseGeometry:
+    """Unions the valid geometries of a layer in parallel.
+
+    Each group of neighbours from "get_groups" is unioned on its own, across
+    "CHECKS_THREADS" threads, as shapely releases the GIL while unioning. The much
+    smaller partial results are then unioned together. Geometries without a parent
+    P-code are not part of any group, so are added in the final union.
+
+    Layers which are a valid coverage are unioned in a single pass with a coverage
+    union instead.
+
+    Args:
+        gdf: Layer to dissolve.
+
+    Returns:
+        Single geometry covering the whole layer.
+    """
+    if is_coverage(gdf):
+        geometry = gdf.geometry[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+        return coverage_union_all(asarray(geometry.array))
+    valid = asarray(get_valid_geometry(gdf).array)
+    groups = get_groups(gdf)
+    grouped = concatenate([*groups, array([], dtype=int)])
+    rest = valid[setdiff1d(arange(len(valid)), grouped)]
+    with ThreadPoolExecutor(CHECKS_THREADS) as executor:
+        partials = list(executor.map(lambda x: union_all(valid[x]), groups))
+    return union_all([*partials, *rest])
+
+
+def get_union(gdf: GeoDataFrame) -> GeoSeries:
+    """Gets the union of the valid geometries of a layer, as dissolving it would.
+
+    Args:
+        gdf: Layer to dissolve.
+
+    Returns:
+        GeoSeries with a single geometry covering the whole layer.
+    """
+    return get_artifact(
+        gdf,
+        "union",
+        lambda x: GeoSeries([dissolve(x)], crs=x.crs),
+    )
+
+
+def get_projected(gdf: GeoDataFrame, epsg: int) -> GeoSeries:
+    """Gets the geometry of a layer reprojected to another CRS.
+
+    Args:
+        gdf: Layer to reproject.
+        epsg: EPSG code of the CRS.
+
+    Returns:
+        GeoSeries in the CRS.
+    """
+    return get_artifact(gdf, f"projected_{epsg}", lambda x: x.geometry.to_crs(epsg))
+
+
+def get_bounds(gdf: GeoDataFrame) -> tuple[float, float, float, float]:
+    """Gets the bounding box of a layer in WGS84.
+
+    Layers already in WGS84 are not reprojected. Transforming only the corners of the
+    bounding box would be cheaper for other layers, but can overstate it by a fraction
+    of a degree, so their reprojection is shared with other checks instead.
+
+    Args:
+        gdf: Layer to get the bounds of.
+
+    Returns:
+        Minimum x, minimum y, maximum x and maximum y in decimal degrees.
+    """
+    if gdf.crs is not None and gdf.crs.to_epsg() == EPSG_WGS84:
+        return tuple(gdf.geometry.total_bounds)
+    return tuple(get_projected(gdf, EPSG_WGS84).total_bounds)
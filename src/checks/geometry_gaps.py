@@ -5,6 +5,8 @@ from shapely import Polygon
 
 from src.config import EPSG_EQUAL_AREA, METERS_PER_KM, CheckReturnList
 
+from .geometry_cache import get_union
+
 
 def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
     """Check for the number of gaps between geometries.
@@ -21,9 +23,7 @@ def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
     for admin_level, gdf in enumerate(gdfs):
         row = {"iso3": iso3, "level": admin_level}
         if gdf.active_geometry_name:
-            valid = gdf.copy()
-            valid.geometry = valid.geometry.make_valid()
-            interiors = valid.dissolve().explode().interiors.tolist()
+            interiors = get_union(gdf).explode().interiors.tolist()
             polygons = [Polygon(x) for y in interiors for x in y]
             if len(polygons):
                 geometry = GeoSeries(polygons, crs=gdf.crs).to_crs(EPSG_EQUAL_AREA)
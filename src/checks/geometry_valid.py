@@ -1,7 +1,6 @@
 from geopandas import GeoDataFrame
 
 from src.config import (
-    EPSG_WGS84,
     GEOJSON_PRECISION,
     METERS_PER_KM,
     POLYGON,
@@ -10,6 +9,8 @@ from src.config import (
 )
 from src.utils import get_epsg_ease
 
+from .geometry_cache import get_bounds, get_projected, get_valid_reasons
+
 
 def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
     """Check properties associated with geometry.
@@ -42,15 +43,15 @@ def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
         row = {"iso3": iso3, "level": admin_level}
         if gdf.active_geometry_name:
             min_x, min_y, max_x, max_y = [
-                round(x, GEOJSON_PRECISION)
-                for x in gdf.geometry.to_crs(EPSG_WGS84).total_bounds
+                round(x, GEOJSON_PRECISION) for x in get_bounds(gdf)
             ]
             epsg_ease = get_epsg_ease(min_y, max_y)
-            area = int(gdf.geometry.to_crs(epsg_ease).area.sum())
+            area = int(get_projected(gdf, epsg_ease).area.sum())
+            reasons = get_valid_reasons(gdf)
             invalid_reason = ", ".join(
                 {
                     reason.split("[")[0]
-                    for reason in gdf.geometry.is_valid_reason()
+                    for reason in reasons
                     if reason != VALID_GEOMETRY
                 },
             )
@@ -63,7 +64,7 @@ def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
                     gdf[~gdf.geometry.geom_type.str.contains(POLYGON)].index,
                 ),
                 "geom_has_z": len(gdf[gdf.geometry.has_z].index),
-                "geom_invalid": len(gdf[~gdf.geometry.is_valid].index),
+                "geom_invalid": int((reasons != VALID_GEOMETRY).sum()),
                 "geom_invalid_reason": invalid_reason,
                 "geom_proj": gdf.geometry.crs.to_epsg(),
                 "geom_min_x": min_x,
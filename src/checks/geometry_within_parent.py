@@ -1,13 +1,57 @@
 from geopandas import GeoDataFrame
+from numpy import asarray, zeros
+from pandas import Series
+from shapely import contains, prepare
 
 from src.config import CheckReturnList
 
 
+def get_within_pcode(
+    gdf: GeoDataFrame,
+    parent: GeoDataFrame,
+    column: str,
+) -> tuple[int, int]:
+    """Counts geometries within a parent, checking each against its own parent first.
+
+    Each geometry is matched to the parent with the same P-code, and tested against
+    the prepared geometry of that parent alone. Only geometries which are not within
+    the parent their P-code points to, or whose P-code does not point to a single
+    parent, are spatially joined to the whole parent layer. Parents are assumed not to
+    overlap, so a geometry within its own parent is not searched for in any other.
+
+    Args:
+        gdf: Layer being checked.
+        parent: Parent layer.
+        column: Name of the column with the P-code of the parent, in both layers.
+
+    Returns:
+        Number of pairs of a geometry within a parent, and the number of those pairs
+        whose P-codes match.
+    """
+    pcodes = parent[column].reset_index(drop=True)
+    pcodes = pcodes[~pcodes.duplicated(keep=False) & pcodes.notna()]
+    positions = gdf[column].map(Series(pcodes.index, index=pcodes.to_numpy()))
+    has_parent = positions.notna().to_numpy()
+    parents = asarray(parent.geometry.array)
+    prepare(parents)
+    is_within = zeros(len(gdf.index), dtype=bool)
+    is_within[has_parent] = contains(
+        parents[positions[has_parent].astype(int).to_numpy()],
+        asarray(gdf.geometry.array)[has_parent],
+    )
+    rest = gdf[~is_within].sjoin(parent, predicate="within")
+    pcode = rest[rest[f"{column}_left"].eq(rest[f"{column}_right"])]
+    matches = int(is_within.sum())
+    return matches + len(rest.index), matches + len(pcode.index)
+
+
 def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
     """Check for the number of geometries within a parent layer.
 
     If a dataset is perfectly hierarchally nested, each geometry will fall within a
-    parent geometry.
+    parent geometry. Where both layers have P-codes of the parent, geometries are
+    checked against the parent their P-code points to (see "get_within_pcode"), rather
+    than against every parent with a spatial join.
 
     Args:
         iso3: ISO3 code of the current location being checked.
@@ -30,23 +74,26 @@ def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
             else:
                 parent = gdfs[admin_level - 1]
                 if parent.active_geometry_name:
-                    within = gdf.sjoin(parent, predicate="within")
-                    row = {
-                        "iso3": iso3,
-                        "level": admin_level,
-                        "geom_not_within_parent": len(gdf.index) - len(within.index),
-                    }
-                    pcode_left = f"ADM{admin_level-1}_PCODE_left"
-                    pcode_right = f"ADM{admin_level-1}_PCODE_right"
-                    if all(x in within.columns for x in [pcode_left, pcode_right]):
-                        pcode = within[
-                            within[f"ADM{admin_level-1}_PCODE_left"].eq(
-                                within[f"ADM{admin_level-1}_PCODE_right"],
-                            )
-                        ]
-                        row |= {
-                            "geom_not_within_pcode": len(within.index)
-                            - len(pcode.index),
+                    column = f"ADM{admin_level-1}_PCODE"
+                    if column in gdf.columns and column in parent.columns:
+                        within_count, pcode_count = get_within_pcode(
+                            gdf,
+                            parent,
+                            column,
+                        )
+                        row = {
+                            "iso3": iso3,
+                            "level": admin_level,
+                            "geom_not_within_parent": len(gdf.index) - within_count,
+                            "geom_not_within_pcode": within_count - pcode_count,
+                        }
+                    else:
+                        within_parent = gdf.sjoin(parent, predicate="within")
+                        row = {
+                            "iso3": iso3,
+                            "level": admin_level,
+                            "geom_not_within_parent": len(gdf.index)
+                            - len(within_parent.index),
                         }
                     check_results.append(row)
     return check_results
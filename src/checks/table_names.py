@@ -6,13 +6,11 @@ from src.config import CheckReturnList
 from src.utils import is_empty
 
 from .table_names_utils import (
-    get_invalid_chars,
+    check_chars,
     has_double_spaces,
     has_strippable_spaces,
-    is_invalid,
     is_invalid_adm0,
     is_lower,
-    is_punctuation,
     is_upper,
 )
 
@@ -42,12 +40,8 @@ def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
             if match(r"^ADM0_(AR|EN|ES|FR|RU|ZH)$", column)
         ]
         names = gdf[name_columns]
-        invalid_chars = "".join(
-            {
-                names[col].map(lambda x, col=col: get_invalid_chars(col, x, iso3)).sum()
-                for col in name_columns
-            },
-        )
+        chars = [check_chars(col, names[col], iso3) for col in name_columns]
+        invalid_chars = set().union(*[x[0] for x in chars])
         row = {
             "iso3": iso3,
             "level": admin_level,
@@ -76,14 +70,7 @@ def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
             "name_lower": sum(
                 [names[col].map(is_lower).sum() for col in name_columns],
             ),
-            "name_no_valid": sum(
-                [
-                    names[col]
-                    .map(lambda x, col=col: is_punctuation(col, x, iso3))
-                    .sum()
-                    for col in name_columns
-                ],
-            ),
+            "name_no_valid": sum(x[1] for x in chars),
             "name_invalid_adm0": sum(
                 [
                     names[col]
@@ -92,13 +79,8 @@ def main(iso3: str, gdfs: list[GeoDataFrame]) -> CheckReturnList:
                     for col in official_names
                 ],
             ),
-            "name_invalid": sum(
-                [
-                    names[col].map(lambda x, col=col: is_invalid(col, x, iso3)).sum()
-                    for col in name_columns
-                ],
-            ),
-            "name_invalid_char_count": len({*list(invalid_chars)}),
+            "name_invalid": sum(x[2] for x in chars),
+            "name_invalid_char_count": len(invalid_chars),
             "name_invalid_chars": ",".join(
                 sorted({f"U+{ord(x):04X}" for x in invalid_chars}),
             ),
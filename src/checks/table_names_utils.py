@@ -1,49 +1,91 @@
+from functools import cache
+
 from hdx.location.country import Country
 from icu import USET_ADD_CASE_MAPPINGS, LocaleData, ULocaleDataExemplarSetType
 from langcodes import tag_is_valid
+from pandas import Series
 
 from src.config import m49, official_languages, unterm
 
 from .table_names_config import auxiliary_codes, exclude_check, punctuation_set
 
 
-def get_char_set(lang: str, iso3: str) -> list[str]:
+@cache
+def get_char_set(lang: str, iso3: str) -> frozenset[str]:
     """Get character set for a language code.
 
+    Built once per language and location, as reading exemplar sets from ICU is far
+    slower than checking names against them.
+
+    Args:
+        lang: 2 letter language code.
+        iso3: ISO-3 country code.
+
+    Returns:
+        Set of valid characters for a language.
+    """
+    return frozenset(
+        [
+            x
+            for y in LocaleData(lang).getExemplarSet(
+                USET_ADD_CASE_MAPPINGS,
+                ULocaleDataExemplarSetType.ES_STANDARD,
+            )
+            for x in y
+        ]
+        + [chr(int(x[2:], 16)) for x in auxiliary_codes.get(f"{lang}-{iso3}", [])],
+    )
+
+
+@cache
+def get_valid_set(lang: str, iso3: str) -> frozenset[str]:
+    """Get character set for a language code, including punctuation.
+
     Args:
         lang: 2 letter language code.
         iso3: ISO-3 country code.
 
     Returns:
-        List of valid characters for a language.
+        Set of characters allowed in a name of a language.
     """
-    return [
-        x
-        for y in LocaleData(lang).getExemplarSet(
-            USET_ADD_CASE_MAPPINGS,
-            ULocaleDataExemplarSetType.ES_STANDARD,
-        )
-        for x in y
-    ] + [chr(int(x[2:], 16)) for x in auxiliary_codes.get(f"{lang}-{iso3}", [])]
+    return get_char_set(lang, iso3) | frozenset(punctuation_set)
+
 
+def check_chars(column: str, names: Series, iso3: str) -> tuple[set[str], int, int]:
+    """Check the characters of every name in a column based on it's language code.
 
-def get_invalid_chars(column: str, name: str | None, iso3: str) -> str:
-    """Check if a value within a column is a valid name based on it's language code.
+    Each distinct name is checked once against the character sets of the language,
+    and counted as many times as it appears in the column.
 
     Args:
         column: column to check.
-        name: value of column.
+        names: values of column.
         iso3: ISO-3 country code.
 
     Returns:
-        True if there are any characters in the name not found in the languages's
-        character set.
+        Characters in the names not found in the language's character set or
+        punctuation, number of names without any character from the language's
+        character set, and number of names with characters not found in the language's
+        character set or punctuation.
     """
+    invalid_chars: set[str] = set()
+    no_valid = 0
+    invalid = 0
     lang = column.split("_")[1].lower()
-    if not name or not name.strip() or not tag_is_valid(lang) or lang in exclude_check:
-        return ""
+    if not tag_is_valid(lang):
+        return invalid_chars, no_valid, invalid
     char_set = get_char_set(lang, iso3)
-    return "".join({char for char in name if char not in char_set + punctuation_set})
+    valid_set = None if lang in exclude_check else get_valid_set(lang, iso3)
+    for name, count in names.value_counts().items():
+        if not name or not name.strip():
+            continue
+        chars = set(name)
+        if char_set.isdisjoint(chars):
+            no_valid += count
+        if valid_set is not None and not chars <= valid_set:
+            invalid_chars |= chars - valid_set
+            invalid += count
+    return invalid_chars, no_valid, invalid
 
 
 def is_invalid_adm0(column: str, name: str | None, iso3: str) -> bool:
@@ -97,44 +139,6 @@ def is_lower(name: str | None) -> bool:
     return name == name.lower() and name.lower() != name.upper()
 
 
-def is_punctuation(column: str, name: str | None, iso3: str) -> bool:
-    """Check if a value within a column is a valid name based on it's language code.
-
-    Args:
-        column: column to check.
-        name: value of column.
-        iso3: ISO-3 country code.
-
-    Returns:
-        True if there are any characters in the name not found in the languages's
-        character set.
-    """
-    lang = column.split("_")[1].lower()
-    if not name or not name.strip() or not tag_is_valid(lang):
-        return False
-    char_set = get_char_set(lang, iso3)
-    return all(char not in char_set for char in name)
-
-
-def is_invalid(column: str, name: str | None, iso3: str) -> bool:
-    """Check if a value within a column is a valid name based on it's language code.
-
-    Args:
-        column: column to check.
-        name: value of column.
-        iso3: ISO-3 country code.
-
-    Returns:
-        True if there are any characters in the name not found in the languages's
-        character set.
-    """
-    lang = column.split("_")[1].lower()
-    if not name or not name.strip() or not tag_is_valid(lang) or lang in exclude_check:
-        return False
-    char_set = get_char_set(lang, iso3)
-    return any(char not in char_set + punctuation_set for char in name)
-
-
 def has_double_spaces(name: str | None) -> bool:
     """Checks if string has double spaces.
 
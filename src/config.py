@@ -1,5 +1,5 @@
 from logging import ERROR, INFO, WARNING, basicConfig, getLogger
-from os import environ, getenv
+from os import cpu_count, environ, getenv
 from pathlib import Path
 from typing import Any
 
@@ -39,13 +39,43 @@ ATTEMPT = int(getenv("ATTEMPT", "5"))
 WAIT = int(getenv("WAIT", "10"))
 TIMEOUT = int(getenv("TIMEOUT", "60"))
 TIMEOUT_DOWNLOAD = int(getenv("TIMEOUT_DOWNLOAD", "600"))
+HTTP_MAX_CONNECTIONS = int(getenv("HTTP_MAX_CONNECTIONS", "100"))
 ADMIN_LEVELS = int(getenv("ADMIN_LEVELS", "5"))
 MULTIPROCESSING = not is_bool(getenv("MULTIPROCESSING_DISABLED", "NO"))
-
+CHECKS_MAX_PENDING = int(getenv("CHECKS_MAX_PENDING", "64"))
+CHECKS_LAYER_CACHE = int(getenv("CHECKS_LAYER_CACHE", "4"))
+CHECKS_PREFETCH = int(getenv("CHECKS_PREFETCH", "2"))
+CHECKS_PREFETCH_MB = int(getenv("CHECKS_PREFETCH_MB", "1000"))
+CHECKS_THREADS = int(
+    getenv("CHECKS_THREADS") or (1 if MULTIPROCESSING else cpu_count() or 1),
+)
+DOWNLOAD_FORCE = is_bool(getenv("DOWNLOAD_FORCE", "NO"))
+DOWNLOAD_CONCURRENCY = int(getenv("DOWNLOAD_CONCURRENCY", "16"))
+DOWNLOAD_CONCURRENCY_HOST = int(getenv("DOWNLOAD_CONCURRENCY_HOST", "4"))
+DOWNLOAD_PAGE_CONCURRENCY = int(getenv("DOWNLOAD_PAGE_CONCURRENCY", "4"))
+DOWNLOAD_PBF = is_bool(getenv("DOWNLOAD_PBF", "NO"))
+DOWNLOAD_STREAM = is_bool(getenv("DOWNLOAD_STREAM", "NO"))
+DOWNLOAD_OBJECTID = is_bool(getenv("DOWNLOAD_OBJECTID", "NO"))
+METADATA_CONCURRENCY = int(getenv("METADATA_CONCURRENCY", "16"))
+HTTP_CACHE = is_bool(getenv("HTTP_CACHE", "NO"))
+HTTP_CACHE_TTL = int(getenv("HTTP_CACHE_TTL", "86400"))
+HTTP_CACHE_SIZE_MB = int(getenv("HTTP_CACHE_SIZE_MB", "1000"))
+HTTP_CACHE_OFFLINE = is_bool(getenv("HTTP_CACHE_OFFLINE", "NO"))
+BENCHMARK_LAYERS = int(getenv("BENCHMARK_LAYERS", "20"))
+BENCHMARK_LATENCY_MS = int(getenv("BENCHMARK_LATENCY_MS", "50"))
+BENCHMARK_ERROR_RATE = int(getenv("BENCHMARK_ERROR_RATE", "0"))
+BENCHMARK_ERROR_RECORDS = int(getenv("BENCHMARK_ERROR_RECORDS", "0"))
+BENCHMARK_MAX_RECORD_COUNT = int(getenv("BENCHMARK_MAX_RECORD_COUNT", "2000"))
+
+DISSOLVE_GROUPS = 4
 EPSG_EQUAL_AREA = 6933
 EPSG_WGS84 = 4326
 GEOJSON_PRECISION = 6
 METERS_PER_KM = 1_000_000
+OVERLAPS_CHUNK = 10_000
+PAGE_RECORDS_DECREASE = 10
+PAGE_RECORDS_INCREASE = 100
+PAGE_RECORDS_MAX = 1000
 PLOTLY_SIMPLIFY = 0.000_01
 POLYGON = "Polygon"
 SLIVER_GAP_AREA_KM = 0.000_1
@@ -64,6 +94,8 @@ images_dir = cwd / "../data/images"
 images_dir.mkdir(parents=True, exist_ok=True)
 tables_dir = cwd / "../data/tables"
 tables_dir.mkdir(parents=True, exist_ok=True)
+cache_dir = cwd / "../data/cache"
+cache_dir.mkdir(parents=True, exist_ok=True)
 
 official_languages = ["ar", "en", "es", "fr", "ru", "zh"]
 romanized_languages = ["en", "es", "fr", "hu", "id", "nl", "pl", "pt", "ro", "sk"]
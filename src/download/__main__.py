@@ -1,12 +1,11 @@
+from asyncio import run
 from logging import getLogger
 from shutil import which
 
-from tqdm import tqdm
-
 from src.config import ADMIN_LEVELS
 from src.utils import get_metadata
 
-from . import httpx, ogr2ogr
+from . import httpx_async, ogr2ogr
 
 logger = getLogger(__name__)
 
@@ -19,10 +18,13 @@ def main() -> None:
     ADM2, etc), downloading all to a local directory.
 
     Uses OGR2OGR if available for downloading, as this is faster and more memory
-    efficient. If unavailable, fall back to using HTTPX.
+    efficient. If unavailable, fall back to using HTTPX. Either way, many layers are
+    downloaded concurrently.
+
+    Layers which have not changed on the server since they were last downloaded are
+    skipped, using the manifest saved next to each GeoPackage.
     """
     logger.info("Starting")
-    download = ogr2ogr.download if which("ogr2ogr") else httpx.download
     records = get_metadata()
     metadata = []
     for record in records:
@@ -31,13 +33,10 @@ def main() -> None:
             for level in range(ADMIN_LEVELS + 1)
             if record[f"itos_index_{level}"] is not None
         )
-    pbar = tqdm(metadata)
-    for row in pbar:
-        iso3 = row["iso3"]
-        lvl = row["admin_level"]
-        idx = row[f"itos_index_{lvl}"]
-        pbar.set_postfix_str(f"{iso3}_ADM{lvl}")
-        download(iso3, lvl, idx, row["itos_url"])
+    if which("ogr2ogr"):
+        ogr2ogr.download_all(metadata)
+    else:
+        run(httpx_async.download_all(metadata))
     logger.info("Finished")
 
 
@@ -0,0 +1,156 @@
+from json import dump, load
+from pathlib import Path
+from shutil import rmtree
+from typing import Any
+
+from pyogrio import read_info
+from pyogrio.errors import DataSourceError
+
+from src.config import boundaries_dir
+
+
+def get_pages_dir(filename: str) -> Path:
+    """Gets the directory where completed pages of a layer are kept.
+
+    Args:
+        filename: File name of the layer.
+
+    Returns:
+        Path of the directory.
+    """
+    return boundaries_dir / f"{filename}.pages"
+
+
+def get_checkpoint_file(filename: str) -> Path:
+    """Gets the file describing the checkpoint of a layer.
+
+    Args:
+        filename: File name of the layer.
+
+    Returns:
+        Path of the file.
+    """
+    return boundaries_dir / f"{filename}.checkpoint.json"
+
+
+def get_partial_file(filename: str) -> Path:
+    """Gets the partial GeoPackage pages of a layer are appended to.
+
+    Args:
+        filename: File name of the layer.
+
+    Returns:
+        Path of the file.
+    """
+    return boundaries_dir / f"{filename}.partial.gpkg"
+
+
+def exists(filename: str) -> bool:
+    """Checks whether a layer has a checkpoint from a previous attempt.
+
+    Args:
+        filename: File name of the layer.
+
+    Returns:
+        True if a checkpoint exists.
+    """
+    return get_checkpoint_file(filename).is_file()
+
+
+def clear(filename: str) -> None:
+    """Removes the checkpoint of a layer, once it has been saved or is out of date.
+
+    Args:
+        filename: File name of the layer.
+    """
+    rmtree(get_pages_dir(filename), ignore_errors=True)
+    get_partial_file(filename).unlink(missing_ok=True)
+    get_checkpoint_file(filename).unlink(missing_ok=True)
+
+
+def load_checkpoint(filename: str, state: dict[str, Any]) -> None:
+    """Resumes the checkpoint of a layer, starting a new one if it is out of date.
+
+    A checkpoint can only be resumed if the layer has the same state on the server as
+    when the checkpoint was created, with the same date of last edit and number of
+    features. Otherwise, the layer has changed on the server, and pages saved before
+    the change would be mixed with pages saved after it, so the pages and the partial
+    GeoPackage are removed and all pages need to be downloaded again. Layers without a
+    date of last edit can only be compared by their number of features.
+
+    Args:
+        filename: File name of the layer.
+        state: Current state of the layer from "src.download.manifest.get_state".
+    """
+    file = get_checkpoint_file(filename)
+    if file.is_file():
+        with Path.open(file) as f:
+            if load(f).get("state") == state:
+                return
+        clear(filename)
+    with Path.open(file, "w") as f:
+        dump({"state": state}, f)
+
+
+def get_offset(filename: str) -> int:
+    """Gets the offset to resume appending pages to the partial GeoPackage of a layer.
+
+    The offset is the number of features already in the partial GeoPackage, rather
+    than a separately saved value, so that it can never disagree with the features
+    that were actually written before a crash.
+
+    Args:
+        filename: File name of the layer.
+
+    Returns:
+        Offset of the first record not yet written, 0 if there is no partial
+        GeoPackage.
+    """
+    try:
+        return read_info(get_partial_file(filename))["features"]
+    except DataSourceError:
+        return 0
+
+
+def load_page(filename: str, offset: int, fmt: str) -> tuple[int, bytes] | None:
+    """Loads a page completed during a previous attempt.
+
+    Args:
+        filename: File name of the layer.
+        offset: Offset of the first record in the page.
+        fmt: Format of the page, either "json" or "pbf".
+
+    Returns:
+        The number of records requested for the page and its raw content, or None if
+        the page has not been completed.
+    """
+    for file in get_pages_dir(filename).glob(f"{offset:09d}_*.{fmt}"):
+        return int(file.stem.split("_")[1]), file.read_bytes()
+    return None
+
+
+def save_page(
+    filename: str,
+    offset: int,
+    records: int,
+    fmt: str,
+    content: bytes,
+) -> None:
+    """Saves a completed page so that it does not need to be downloaded again.
+
+    The page is written to a temporary file first and renamed, so that a crash while
+    writing never leaves an incomplete page behind.
+
+    Args:
+        filename: File name of the layer.
+        offset: Offset of the first record in the page.
+        records: The number of records requested for the page.
+        fmt: Format of the page, either "json" or "pbf".
+        content: Raw content of the page.
+    """
+    pages_dir = get_pages_dir(filename)
+    pages_dir.mkdir(exist_ok=True)
+    file = pages_dir / f"{offset:09d}_{records}.{fmt}"
+    tmp = file.with_suffix(".tmp")
+    tmp.write_bytes(content)
+    tmp.replace(file)
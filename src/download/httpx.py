@@ -1,14 +1,25 @@
-from json import dump
+from io import BytesIO
+from json import dump, loads
 from logging import getLogger
 from pathlib import Path
+from re import compile
 from typing import Any
 
-from geopandas import read_file
-from pandas import to_datetime
-from tenacity import retry, stop_after_attempt, wait_fixed
+from geopandas import GeoDataFrame, read_file
+from httpx import Response
+from pandas import Series, concat, to_datetime
+from pyogrio import read_info
+from pyogrio.errors import DataSourceError
 
-from src.config import ATTEMPT, TIMEOUT, TIMEOUT_DOWNLOAD, WAIT, boundaries_dir
-from src.utils import client_get
+from src.config import (
+    PAGE_RECORDS_DECREASE,
+    PAGE_RECORDS_INCREASE,
+    PAGE_RECORDS_MAX,
+    boundaries_dir,
+)
+
+from . import checkpoint, stats
+from .pbf import read_pbf
 
 logger = getLogger(__name__)
 
@@ -18,6 +29,7 @@ def get_layer(
     idx: int,
     records: int | None = None,
     offset: int | None = None,
+    fmt: str = "json",
 ) -> tuple[str, dict[str, Any]]:
     """Builds a URL used for retrieving ESRI JSON from an ArcGIS Feature Service.
 
@@ -29,6 +41,9 @@ def get_layer(
     "resultRecordCount" and "resultOffset" query parameters are used to paginate through
     results.
 
+    Setting the format to "pbf" requests the compact protocol buffer encoding instead,
+    which is smaller to transfer and faster to read than ESRI JSON.
+
     Args:
         url: Base URL of an ArcGIS Feature Service.
         idx: Index of a feature service layer.
@@ -36,12 +51,13 @@ def get_layer(
         pagination.
         offset: For pagination, skips the specified number of records and starts from
         the next record.
+        fmt: Format of the response, either "json" or "pbf".
 
     Returns:
         URL and query parameters which returns ESRI JSON.
     """
     query: dict = {
-        "f": "json",
+        "f": fmt,
         "where": "1=1",
         "outFields": "*",
         "orderByFields": "OBJECTID",
@@ -77,17 +93,111 @@ def get_layer_count(url: str, idx: int) -> tuple[str, dict[str, Any]]:
     return f"{url}/{idx}/query", query
 
 
+def get_layer_ids(url: str, idx: int) -> tuple[str, dict[str, Any]]:
+    """Gets a URL containing the object IDs of every feature in a layer.
+
+    The query parameter "f" (format) is set to return JSON (default is HTML), "where" is
+    a required parameter with the value "1=1" to return all features, and
+    "returnIdsOnly" tells the server to return only a list of object IDs rather than
+    ESRI JSON. This list is not limited by the "maxRecordCount" property of the layer.
+
+    Args:
+        url: Base URL of an ArcGIS Feature Service.
+        idx: Index of a feature service layer.
+
+    Returns:
+        URL and query parameters containing the object IDs of every feature in a layer.
+    """
+    query = {
+        "f": "json",
+        "where": "1=1",
+        "returnIdsOnly": True,
+    }
+    return f"{url}/{idx}/query", query
+
+
+def get_layer_range(
+    url: str,
+    idx: int,
+    first: int,
+    last: int,
+    fmt: str = "json",
+) -> tuple[str, dict[str, Any]]:
+    """Builds a URL used for retrieving a range of object IDs from a layer.
+
+    Same as "get_layer", except that "where" selects features with an object ID between
+    "first" and "last" instead of using "resultOffset". The server can look up a range
+    of object IDs from its index, rather than sorting the layer and skipping every
+    record before the offset, which gets slower the deeper into a layer a page is.
+
+    Args:
+        url: Base URL of an ArcGIS Feature Service.
+        idx: Index of a feature service layer.
+        first: Object ID of the first feature in the range.
+        last: Object ID of the last feature in the range.
+        fmt: Format of the response, either "json" or "pbf".
+
+    Returns:
+        URL and query parameters which returns ESRI JSON.
+    """
+    query = {
+        "f": fmt,
+        "where": f"OBJECTID BETWEEN {first} AND {last}",
+        "outFields": "*",
+        "orderByFields": "OBJECTID",
+    }
+    return f"{url}/{idx}/query", query
+
+
+def read_ids(data: dict) -> Series:
+    """Reads the object IDs of a layer, indexed by the offset of each feature.
+
+    Args:
+        data: Response to a "returnIdsOnly" query represented as a dict.
+
+    Returns:
+        Series of sorted object IDs, with the offset of each feature as its index.
+    """
+    return Series(sorted(data.get("objectIds") or []), dtype="int64")
+
+
+def normalize(gdf: GeoDataFrame, filename: str) -> GeoDataFrame:
+    """Validates a layer read from ESRI JSON and normalizes its attributes.
+
+    Geopandas will ignore "OBJECTID" and create it's own "fid" field, so drop "OBJECTID"
+    to remove duplicate id fields. In ArcGIS versions prior to ArcGIS Pro 2.3,
+    Integer64, Date and Time field types are not supported. Pandas also does not support
+    Date types, only DateTime. Since data is represented as dates within DateTime
+    fields, set the timezone to UTC so that they are consistently interpreted.
+
+    Args:
+        gdf: GeoDataFrame read from ESRI JSON.
+        filename: File name of the output.
+
+    Raises:
+        RuntimeError: Raises an error with the filename if no polygons are found, as
+        the ArcGIS server may return empty geometry.
+
+    Returns:
+        GeoDataFrame ready to be saved as a GeoPackage.
+    """
+    is_polygon = "Polygon" in gdf["geometry"].geom_type.to_numpy()
+    is_multi_polygon = "MultiPolygon" in gdf["geometry"].geom_type.to_numpy()
+    if not is_polygon and not is_multi_polygon:
+        raise RuntimeError(filename)
+    gdf = gdf.drop(columns=["OBJECTID"], errors="ignore")
+    for col in gdf.select_dtypes(include=["datetime"]):
+        gdf[col] = to_datetime(gdf[col], utc=True)
+    return gdf
+
+
 def save_file(data: dict, filename: str) -> None:
     """Saves ESRI JSON data as a GeoPackage, normalizing attributes.
 
     First, temporarily saves an ESRI JSON file to disk to free up memory.
 
     Use Geopandas to read the file using pyogrio engine with arrow for the most
-    efficiency. Geopandas will ignore "OBJECTID" and create it's own "fid" field, so
-    drop "OBJECTID" to remove duplicate id fields. In ArcGIS versions prior to ArcGIS
-    Pro 2.3, Integer64, Date and Time field types are not supported. Pandas also does
-    not support Date types, only DateTime. Since data is represented as dates within
-    DateTime fields, set the timezone to UTC so that they are consistently interpreted.
+    efficiency, then normalize attributes.
 
     Finally, save the result as a GeoPackage to disk and delete the temporary ESRI JSON.
 
@@ -98,70 +208,265 @@ def save_file(data: dict, filename: str) -> None:
     tmp = boundaries_dir / f"{filename}.json"
     with Path.open(tmp, "w") as f:
         dump(data, f, separators=(",", ":"))
-    gdf = read_file(tmp, use_arrow=True)
-    is_polygon = "Polygon" in gdf["geometry"].geom_type.to_numpy()
-    is_multi_polygon = "MultiPolygon" in gdf["geometry"].geom_type.to_numpy()
-    if not is_polygon and not is_multi_polygon:
-        raise RuntimeError(filename)
-    gdf = gdf.drop(columns=["OBJECTID"], errors="ignore")
-    for col in gdf.select_dtypes(include=["datetime"]):
-        gdf[col] = to_datetime(gdf[col], utc=True)
+    with stats.timed("parse_seconds"):
+        gdf = read_file(tmp, use_arrow=True)
+    gdf = normalize(gdf, filename)
     gdf.to_file(boundaries_dir / f"{filename}.gpkg")
     tmp.unlink(missing_ok=True)
 
 
-@retry(stop=stop_after_attempt(ATTEMPT), wait=wait_fixed(WAIT))
-def download(iso3: str, lvl: int, idx: int, url: str) -> None:
-    """Downloads ESRI JSON from an ArcGIS Feature Server and saves as GeoPackage.
+def save_gdf(gdfs: list[GeoDataFrame], filename: str) -> None:
+    """Saves pages of a layer read from PBF as a GeoPackage, normalizing attributes.
+
+    Args:
+        gdfs: List of GeoDataFrames, one for each page of the layer.
+        filename: File name of the output.
+    """
+    gdf = concat(gdfs, ignore_index=True).sort_values("OBJECTID", ignore_index=True)
+    normalize(gdf, filename).to_file(boundaries_dir / f"{filename}.gpkg")
 
-    First, attempts to download ESRI JSON in a single request. This request may fail due
-    to memory issues on the server, in which case the result will return the key
-    "error". Additionally, if the number of features returned exceeds the
-    "maxRecordCount" property, it will contain the key "exceededTransferLimit" in the
-    result indicating that only part of the dataset has been downloaded.
 
-    Otherwise, make a query to obtain the total number of records for a layer. Starting
-    with "1000" and reducing by factors of "10", try to paginate through the layer with
-    multiple requests. "1000" is a value that will succeed for most layers, however
-    layers with excessively large geometries will require smaller sets of records to
-    avoid overloading the server's memory. When all records have been obtained through
-    pagination, save the result.
+def is_pbf(response: Response) -> bool:
+    """Checks whether a response is encoded as PBF.
 
-    If at the end of this loop, the function is unable to download a layer, it is likely
-    that a network error has occured. The RuntimeError will trigger tenacity to retry
-    the function again from the start.
+    Servers which do not support PBF return an ESRI JSON error or HTML instead.
 
     Args:
-        iso3: A valid ISO 3166-1 alpha-3 code.
-        lvl: Admin level of the layer.
-        idx: Index the layer is available at on the ArcGIS Feature Service.
-        url: Base URL of an ArcGIS Feature Service.
+        response: HTTP response to a query requested with "f=pbf".
 
-    Raises:
-        RuntimeError: Raises an error with the filename of a layer unable to be
-        downloaded.
-    """
-    filename = f"{iso3}_adm{lvl}".lower()
-    layer_url, layer_query = get_layer(url, idx)
-    esri_json = client_get(layer_url, TIMEOUT_DOWNLOAD, layer_query).json()
-    if "error" not in esri_json and "exceededTransferLimit" not in esri_json:
-        save_file(esri_json, filename)
-    else:
-        count_url, count_query = get_layer_count(url, idx)
-        count = client_get(count_url, TIMEOUT, count_query).json()["count"]
-        for records in [1000, 100, 10, 1]:
-            result = None
-            for offset in range(0, count, records):
-                layer_url, layer_query = get_layer(url, idx, records, offset)
-                esri_json = client_get(layer_url, TIMEOUT_DOWNLOAD, layer_query).json()
-                if "error" in esri_json:
-                    break
-                if result is None:
-                    result = esri_json
-                else:
-                    result["features"].extend(esri_json["features"])
-            if result is not None:
-                save_file(result, filename)
-                break
-    if not (boundaries_dir / f"{filename}.gpkg").is_file():
-        raise RuntimeError(filename)
+    Returns:
+        True if the response is a protocol buffer.
+    """
+    return response.headers.get("content-type", "").startswith(
+        "application/x-protobuf",
+    )
+
+
+def read_page(content: bytes, fmt: str) -> dict | GeoDataFrame:
+    """Reads a page of a layer in the format it was requested in.
+
+    Args:
+        content: Raw body of an ArcGIS query response containing a page of a layer.
+        fmt: Format of the response, either "json" or "pbf".
+
+    Returns:
+        ESRI JSON represented as a dict, or a GeoDataFrame if the format is "pbf".
+    """
+    with stats.timed("parse_seconds"):
+        if fmt == "pbf":
+            return read_pbf(content)[0]
+        return loads(content)
+
+
+def read_frame(content: bytes) -> GeoDataFrame:
+    """Reads a page of raw ESRI JSON into a GeoDataFrame.
+
+    The response body is read directly from memory with pyogrio and arrow, avoiding
+    both a parsed copy of the JSON and a temporary file on disk.
+
+    Args:
+        content: Raw body of an ArcGIS query response containing ESRI JSON.
+
+    Returns:
+        GeoDataFrame of the features in the page.
+    """
+    with stats.timed("parse_seconds"):
+        return read_file(BytesIO(content), use_arrow=True)
+
+
+def count_features(page: dict | GeoDataFrame) -> int:
+    """Counts the features returned in a page of a layer.
+
+    Servers return at most "maxRecordCount" features for a query, which may be fewer
+    than the number of records requested, so the number of features actually returned
+    is what pagination needs to advance by.
+
+    Args:
+        page: Page of ESRI JSON represented as a dict, or a GeoDataFrame.
+
+    Returns:
+        Number of features in the page.
+    """
+    if isinstance(page, GeoDataFrame):
+        return len(page)
+    return len(page.get("features") or [])
+
+
+def get_object_ids(page: dict | GeoDataFrame) -> list[int]:
+    """Gets the object IDs of the features in a page of a layer.
+
+    Args:
+        page: Page of ESRI JSON represented as a dict, or a GeoDataFrame.
+
+    Returns:
+        List of object IDs in the order the features were returned.
+    """
+    if isinstance(page, GeoDataFrame):
+        return page["OBJECTID"].tolist()
+    oid = page.get("objectIdFieldName", "OBJECTID")
+    return [x["attributes"][oid] for x in page.get("features") or []]
+
+
+def is_page_valid(
+    page: dict | GeoDataFrame,
+    requested: int,
+    ids: Series | None,
+    offset: int,
+) -> bool:
+    """Checks whether a page holds the features expected at its offset.
+
+    A page may hold fewer features than requested, if the server capped it at
+    "maxRecordCount", but never none or more. If the page was requested as a range of
+    object IDs, the features returned must also be the first ones of the range, so that
+    the next page can start from the object ID after the last one returned.
+
+    Args:
+        page: Page of ESRI JSON represented as a dict, or a GeoDataFrame.
+        requested: The number of records requested for the page.
+        ids: Series of object IDs indexed by offset, or None if paginating by offset.
+        offset: Offset of the first record in the page.
+
+    Returns:
+        True if the page can be kept.
+    """
+    received = count_features(page)
+    if not 0 < received <= requested:
+        return False
+    if ids is None:
+        return True
+    return get_object_ids(page) == ids.loc[offset : offset + received - 1].tolist()
+
+
+def is_complete(filename: str, count: int) -> bool:
+    """Checks whether a saved layer has every feature the server reported.
+
+    Args:
+        filename: File name of the layer.
+        count: Total number of features in the layer on the server.
+
+    Returns:
+        True if the GeoPackage of the layer exists and has exactly "count" features.
+    """
+    try:
+        info = read_info(boundaries_dir / f"{filename}.gpkg")
+    except DataSourceError:
+        return False
+    return info["features"] == count
+
+
+def is_error(content: bytes) -> bool:
+    """Checks whether a raw ArcGIS response is an error without parsing it.
+
+    Errors are returned as a small JSON object starting with the key "error", so only
+    the start of the response needs to be checked, rather than parsing a full page.
+
+    Args:
+        content: Raw body of an ArcGIS query response.
+
+    Returns:
+        True if the response is an error.
+    """
+    return bool(compile(rb'^\s*\{\s*"error"\s*:').match(content[:64]))
+
+
+def save_page(gdf: GeoDataFrame, filename: str, *, append: bool) -> None:
+    """Saves a page of a layer to a partial GeoPackage.
+
+    Each page is either written as a new partial GeoPackage, or appended to an existing
+    one. The layer name is set explicitly so that it matches the final file once
+    renamed.
+
+    Args:
+        gdf: Page of the layer from "read_frame".
+        filename: File name of the output.
+        append: Append to the partial GeoPackage instead of overwriting it.
+    """
+    gdf = normalize(gdf, filename)
+    gdf.to_file(
+        checkpoint.get_partial_file(filename),
+        layer=filename,
+        mode="a" if append else "w",
+    )
+
+
+def commit_pages(filename: str) -> None:
+    """Replaces the GeoPackage of a layer with its completed partial GeoPackage.
+
+    Args:
+        filename: File name of the output.
+    """
+    checkpoint.get_partial_file(filename).replace(boundaries_dir / f"{filename}.gpkg")
+
+
+def merge_pages(pages: list[dict]) -> dict:
+    """Merges pages of ESRI JSON into a single result ordered by object ID.
+
+    Pages may arrive in any order when fetched concurrently, so features are sorted by
+    the object ID field named in the response ("OBJECTID" by default) to give the same
+    order as a single request.
+
+    Args:
+        pages: List of ESRI JSON pages represented as dicts.
+
+    Returns:
+        ESRI JSON containing the features of every page.
+    """
+    result = pages[0]
+    oid = result.get("objectIdFieldName", "OBJECTID")
+    result["features"] = sorted(
+        (feature for page in pages for feature in page["features"]),
+        key=lambda x: x["attributes"][oid],
+    )
+    return result
+
+
+def get_records(requested: int, limit: int | None, *, error: bool) -> int:
+    """Adapts the number of records requested per page to how the server responds.
+
+    When a page fails, the number of records is divided by "PAGE_RECORDS_DECREASE", as
+    layers with excessively large geometries need smaller sets of records to avoid
+    overloading the server's memory. When a page succeeds, "PAGE_RECORDS_INCREASE"
+    records are added, up to "PAGE_RECORDS_MAX", so that only the offsets around large
+    geometries are requested in small pages.
+
+    While the pages requested are still within the last page which failed, they also
+    stay below half of "limit", the smallest number of records that has failed there,
+    so the same error is not requested again and again. Callers clear the limit once
+    the offset is past the end of that page (see "get_limit").
+
+    Args:
+        requested: The number of records requested for the last page, or the number of
+        features returned if the server returned fewer.
+        limit: The smallest number of records which has failed around the current
+        offset, or None if none has.
+        error: Whether the last page returned an error.
+
+    Returns:
+        The number of records to request for the next page.
+    """
+    if error:
+        return max(1, requested // PAGE_RECORDS_DECREASE)
+    records = min(PAGE_RECORDS_MAX, requested + PAGE_RECORDS_INCREASE)
+    if limit is not None:
+        records = min(records, limit // 2)
+    return max(1, records)
+
+
+def get_limit(
+    limit: int | None,
+    requested: int,
+    offset: int,
+) -> tuple[int, int]:
+    """Updates the limit of records after a page failed, and where it stops applying.
+
+    Args:
+        limit: The smallest number of records which has failed around the current
+        offset, or None if none has.
+        requested: The number of records requested for the page which failed.
+        offset: Offset of the first record in the page which failed.
+
+    Returns:
+        The new limit, and the offset after the last record of the page which failed,
+        from which the limit is cleared.
+    """
+    return min(limit or requested, requested), offset + requested
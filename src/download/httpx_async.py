@@ -0,0 +1,526 @@
+from asyncio import Semaphore, as_completed, create_task, gather, to_thread
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable
+from functools import partial
+from logging import getLogger
+from typing import Any
+from urllib.parse import urlparse
+
+from geopandas import GeoDataFrame
+from httpx import Response
+from pandas import Series
+from tenacity import retry, stop_after_attempt, wait_fixed
+from tqdm import tqdm
+
+from src import cache
+from src.config import (
+    ATTEMPT,
+    DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_CONCURRENCY_HOST,
+    DOWNLOAD_OBJECTID,
+    DOWNLOAD_PAGE_CONCURRENCY,
+    DOWNLOAD_PBF,
+    DOWNLOAD_STREAM,
+    PAGE_RECORDS_MAX,
+    TIMEOUT,
+    TIMEOUT_DOWNLOAD,
+    WAIT,
+)
+from src.utils import async_client_get, close_async_client
+
+from . import checkpoint, manifest, stats
+from .httpx import (
+    commit_pages,
+    count_features,
+    get_layer,
+    get_layer_count,
+    get_layer_ids,
+    get_layer_range,
+    get_limit,
+    get_records,
+    is_complete,
+    is_error,
+    is_page_valid,
+    is_pbf,
+    merge_pages,
+    read_frame,
+    read_ids,
+    read_page,
+    save_file,
+    save_gdf,
+    save_page,
+)
+from .pbf import read_pbf
+
+logger = getLogger(__name__)
+
+
+async def layer_get(
+    url: str,
+    timeout_seconds: int,
+    params: dict,
+) -> Response:
+    """HTTP GET for a layer, recording telemetry of the response and any retries.
+
+    Args:
+        url: A valid URL.
+        timeout_seconds: Amount in seconds to wait between retries.
+        params: URL query parameters included in the request.
+
+    Returns:
+        HTTP response.
+    """
+    get = async_client_get.retry_with(before_sleep=stats.record_retry)
+    response = await get(url, timeout_seconds, params)
+    stats.record_response(response)
+    return response
+
+
+async def get_offsets(url: str, idx: int) -> range | Series:
+    """Gets the offsets of every record in a layer, used to paginate through it.
+
+    By default, the total number of records is requested, and pages are requested by
+    offset. If "DOWNLOAD_OBJECTID" is enabled, the object ID of every record is
+    requested instead, and pages are requested by ranges of object IDs (see
+    "get_layer_range").
+
+    Args:
+        url: Base URL of an ArcGIS Feature Service.
+        idx: Index of a feature service layer.
+
+    Returns:
+        Range of offsets, or Series of object IDs indexed by offset.
+    """
+    if DOWNLOAD_OBJECTID:
+        ids_url, ids_query = get_layer_ids(url, idx)
+        response = await layer_get(ids_url, TIMEOUT, ids_query)
+        return read_ids(response.json())
+    count_url, count_query = get_layer_count(url, idx)
+    response = await layer_get(count_url, TIMEOUT, count_query)
+    return range(response.json()["count"])
+
+
+async def iter_pages(  # noqa: PLR0913
+    url: str,
+    idx: int,
+    offsets: range | Series,
+    read: Callable[[bytes], dict | GeoDataFrame],
+    fmt: str = "json",
+    filename: str | None = None,
+) -> AsyncIterator[dict | GeoDataFrame]:
+    """Iterates through the pages of a range of records with adaptive page sizes.
+
+    Pages which succeed are kept, and only the offset that failed is requested again
+    with fewer records, continuing from there rather than restarting the range.
+
+    Servers return at most "maxRecordCount" features for a query, which may be fewer
+    than requested, so each page is read as it arrives and the offset advances by the
+    number of features it contains. The next page then starts from the first feature
+    which has not been returned yet, rather than skipping over the rest of the page.
+
+    If a filename is given, every page which succeeds is also saved as a checkpoint of
+    the layer. Pages saved by a previous attempt are read from disk instead of being
+    requested again, so a retry continues from the last page that succeeded.
+
+    If object IDs are given instead of a range, each page is requested as the range of
+    object IDs between its first and last record. Pages still cover the same offsets,
+    so checkpoints are shared by both ways of paginating. A range is also capped by
+    "maxRecordCount", so the next page starts from the first object ID not returned,
+    and the object IDs of every page are checked against the ones expected at its
+    offsets. Gaps in object IDs are skipped by the range rather than hiding missing
+    features.
+
+    Args:
+        url: Base URL of an ArcGIS Feature Service.
+        idx: Index of a feature service layer.
+        offsets: Range of record offsets, from the first record to the one after the
+        last, or Series of object IDs indexed by offset (see "get_offsets").
+        read: Function reading the raw content of a page, run in a separate thread.
+        fmt: Format of the response, either "json" or "pbf".
+        filename: File name of the layer, used to checkpoint pages.
+
+    Yields:
+        Pages of the layer, as returned by "read".
+
+    Raises:
+        RuntimeError: Raises an error if a single record cannot be downloaded, if the
+        server returns no features or more than requested, or if a range of object IDs
+        returns different object IDs than expected.
+    """
+    layer = f"{url}/{idx}"
+    ids = None
+    if isinstance(offsets, Series):
+        ids, offsets = offsets, range(offsets.index[0], offsets.index[-1] + 1)
+    offset = offsets.start
+    records = PAGE_RECORDS_MAX
+    limit = None
+    end = offset
+    while offset < offsets.stop:
+        saved = None
+        if filename:
+            saved = await to_thread(checkpoint.load_page, filename, offset, fmt)
+        if saved is not None:
+            received, content = saved
+            yield await to_thread(read, content)
+            offset += received
+            continue
+        requested = min(records, offsets.stop - offset)
+        layer_url, layer_query = (
+            get_layer(url, idx, requested, offset, fmt)
+            if ids is None
+            else get_layer_range(
+                url,
+                idx,
+                ids.loc[offset],
+                ids.loc[offset + requested - 1],
+                fmt,
+            )
+        )
+        response = await layer_get(layer_url, TIMEOUT_DOWNLOAD, layer_query)
+        if is_error(response.content):
+            if requested == 1:
+                raise RuntimeError(layer)
+            stats.record_page_error()
+            limit, end = get_limit(limit, requested, offset)
+            records = get_records(requested, limit, error=True)
+            continue
+        page = await to_thread(read, response.content)
+        if not is_page_valid(page, requested, ids, offset):
+            raise RuntimeError(layer)
+        received = count_features(page)
+        stats.record_page(received)
+        if filename and response.is_success:
+            await to_thread(
+                checkpoint.save_page,
+                filename,
+                offset,
+                received,
+                fmt,
+                response.content,
+            )
+        yield page
+        offset += received
+        if offset >= end:
+            limit = None
+        records = get_records(received, limit, error=False)
+
+
+async def get_pages(
+    url: str,
+    idx: int,
+    offsets: range | Series,
+    fmt: str = "json",
+    filename: str | None = None,
+) -> list[dict | GeoDataFrame]:
+    """Fetches every page of a layer concurrently.
+
+    As the offset of every record is known, the layer is split into ranges of
+    "PAGE_RECORDS_MAX" records which are all scheduled up front. The number of ranges
+    requested at the same time is limited by "DOWNLOAD_PAGE_CONCURRENCY". Each range
+    adapts its own page size, so a range containing large geometries does not slow
+    down the others.
+
+    Args:
+        url: Base URL of an ArcGIS Feature Service.
+        idx: Index of a feature service layer.
+        offsets: Offsets of every record in a layer from "get_offsets".
+        fmt: Format of the response, either "json" or "pbf".
+        filename: File name of the layer, used to checkpoint pages.
+
+    Returns:
+        List of ESRI JSON pages, or GeoDataFrames if the format is "pbf".
+    """
+    limit = Semaphore(DOWNLOAD_PAGE_CONCURRENCY)
+    read = partial(read_page, fmt=fmt)
+
+    async def get_range(start: int) -> list[dict | GeoDataFrame]:
+        stop = start + PAGE_RECORDS_MAX
+        chunk = (
+            offsets[start:stop]
+            if isinstance(offsets, range)
+            else offsets.iloc[start:stop]
+        )
+        async with limit:
+            return [
+                page async for page in iter_pages(url, idx, chunk, read, fmt, filename)
+            ]
+
+    starts = range(0, len(offsets), PAGE_RECORDS_MAX)
+    tasks = [create_task(get_range(x)) for x in starts]
+    try:
+        ranges = await gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return [page for pages in ranges for page in pages]
+
+
+async def download_pbf(
+    iso3: str,
+    lvl: int,
+    idx: int,
+    url: str,
+    state: dict[str, Any],
+) -> bool:
+    """Downloads a layer encoded as PBF from an ArcGIS Feature Server.
+
+    Follows the same steps as "download_json", requesting the layer in a single request
+    first, and paginating through the layer concurrently if the transfer limit is
+    exceeded or the single request returns an error. Pages are read directly into
+    GeoDataFrames, without ESRI JSON. Whether the server supports PBF is taken from the
+    layer description (see "src.download.manifest.get_state"), so that a layer too large
+    for a single request is still paginated in PBF rather than falling back to ESRI
+    JSON. As in "download_json", a layer with checkpointed pages skips the single
+    request.
+
+    Args:
+        iso3: A valid ISO 3166-1 alpha-3 code.
+        lvl: Admin level of the layer.
+        idx: Index the layer is available at on the ArcGIS Feature Service.
+        url: Base URL of an ArcGIS Feature Service.
+        state: State of the layer from "src.download.manifest.get_state".
+
+    Returns:
+        True if the layer was saved, or False if the server does not support PBF.
+
+    Raises:
+        RuntimeError: Raises an error with the filename of a layer without features.
+    """
+    filename = f"{iso3}_adm{lvl}".lower()
+    if not state["pbf"]:
+        return False
+    if not await to_thread(checkpoint.exists, filename):
+        layer_url, layer_query = get_layer(url, idx, fmt="pbf")
+        response = await layer_get(layer_url, TIMEOUT_DOWNLOAD, layer_query)
+        if is_pbf(response):
+            with stats.timed("parse_seconds"):
+                gdf, exceeded = await to_thread(read_pbf, response.content)
+            if not exceeded:
+                await to_thread(save_gdf, [gdf], filename)
+                return True
+        elif not is_error(response.content):
+            return False
+    offsets = await get_offsets(url, idx)
+    if len(offsets) == 0:
+        raise RuntimeError(filename)
+    await to_thread(checkpoint.load_checkpoint, filename, state)
+    gdfs = await get_pages(url, idx, offsets, "pbf", filename)
+    await to_thread(save_gdf, gdfs, filename)
+    await to_thread(checkpoint.clear, filename)
+    return True
+
+
+async def download_json(
+    iso3: str,
+    lvl: int,
+    idx: int,
+    url: str,
+    state: dict[str, Any],
+) -> None:
+    """Downloads ESRI JSON from an ArcGIS Feature Server and saves as GeoPackage.
+
+    First, attempts to download ESRI JSON in a single request. This request may fail due
+    to memory issues on the server, in which case the result will return the key
+    "error". Additionally, if the number of features returned exceeds the
+    "maxRecordCount" property, it will contain the key "exceededTransferLimit" in the
+    result indicating that only part of the dataset has been downloaded.
+
+    Otherwise, make a query to obtain the total number of records for a layer, and
+    paginate through the layer with multiple requests. Pages start with "1000" records,
+    a value that will succeed for most layers, and adapt their size around offsets
+    where the server returns an error (see "get_records"). As every offset is known from
+    the count, pages are fetched concurrently. When all records have been obtained
+    through pagination, merge the pages in object ID order and save the result.
+
+    If "DOWNLOAD_OBJECTID" is enabled, the object IDs of every record are obtained
+    instead of the count, and pages are requested by ranges of object IDs rather than
+    offsets, which is faster for servers to answer deep into very large layers.
+
+    Pages are checkpointed as they arrive (see "src.download.checkpoint"), so a retry,
+    or a later run after a crash, skips the single request and only fetches the pages
+    which are missing. Checkpoints are discarded if the layer has been edited since,
+    and removed once the layer has been saved.
+
+    Saving the GeoPackage is CPU bound, so it is run in a separate thread to avoid
+    blocking other downloads.
+
+    Args:
+        iso3: A valid ISO 3166-1 alpha-3 code.
+        lvl: Admin level of the layer.
+        idx: Index the layer is available at on the ArcGIS Feature Service.
+        url: Base URL of an ArcGIS Feature Service.
+        state: State of the layer from "src.download.manifest.get_state".
+
+    Raises:
+        RuntimeError: Raises an error with the filename of a layer without features.
+    """
+    filename = f"{iso3}_adm{lvl}".lower()
+    esri_json = {}
+    if not await to_thread(checkpoint.exists, filename):
+        layer_url, layer_query = get_layer(url, idx)
+        response = await layer_get(layer_url, TIMEOUT_DOWNLOAD, layer_query)
+        with stats.timed("parse_seconds"):
+            esri_json = response.json()
+    if (
+        esri_json
+        and "error" not in esri_json
+        and "exceededTransferLimit" not in esri_json
+    ):
+        await to_thread(save_file, esri_json, filename)
+    else:
+        offsets = await get_offsets(url, idx)
+        if len(offsets) == 0:
+            raise RuntimeError(filename)
+        await to_thread(checkpoint.load_checkpoint, filename, state)
+        pages = await get_pages(url, idx, offsets, filename=filename)
+        await to_thread(save_file, merge_pages(pages), filename)
+        await to_thread(checkpoint.clear, filename)
+
+
+async def download_stream(
+    iso3: str,
+    lvl: int,
+    idx: int,
+    url: str,
+    state: dict[str, Any],
+) -> None:
+    """Downloads ESRI JSON page by page, appending each page to a GeoPackage.
+
+    Unlike "download_json", whole layers are never held in memory. The total number of
+    records is obtained first, and pages are then requested in order with the same
+    adaptive page sizes as "download_json". Each page is written to a partial
+    GeoPackage as soon as it arrives, so peak memory is around a single page. Only once
+    every page has been written is the partial GeoPackage moved into place, so that a
+    failed attempt never leaves an incomplete layer behind. Rather than keeping raw
+    pages on disk as "download_json" does, a retry resumes from the number of features
+    already in the partial GeoPackage (see "src.download.checkpoint.get_offset"), so
+    the layer is never stored twice. For the same reason, pages bypass the HTTP cache.
+
+    Args:
+        iso3: A valid ISO 3166-1 alpha-3 code.
+        lvl: Admin level of the layer.
+        idx: Index the layer is available at on the ArcGIS Feature Service.
+        url: Base URL of an ArcGIS Feature Service.
+        state: State of the layer from "src.download.manifest.get_state".
+
+    Raises:
+        RuntimeError: Raises an error with the filename of a layer without features.
+    """
+    filename = f"{iso3}_adm{lvl}".lower()
+    offsets = await get_offsets(url, idx)
+    if len(offsets) == 0:
+        raise RuntimeError(filename)
+    await to_thread(checkpoint.load_checkpoint, filename, state)
+    start = await to_thread(checkpoint.get_offset, filename)
+    remaining = offsets[start:] if isinstance(offsets, range) else offsets.iloc[start:]
+    with cache.bypassed():
+        if len(remaining) > 0:
+            async for gdf in iter_pages(url, idx, remaining, read_frame):
+                await to_thread(save_page, gdf, filename, append=start > 0)
+                start += len(gdf)
+    await to_thread(commit_pages, filename)
+    await to_thread(checkpoint.clear, filename)
+
+
+@retry(
+    stop=stop_after_attempt(ATTEMPT),
+    wait=wait_fixed(WAIT),
+    before_sleep=stats.record_retry,
+)
+async def download(
+    iso3: str,
+    lvl: int,
+    idx: int,
+    url: str,
+    state: dict[str, Any],
+) -> None:
+    """Downloads a layer from an ArcGIS Feature Server and saves as GeoPackage.
+
+    By default, downloads ESRI JSON with "download_json". If "DOWNLOAD_STREAM" is
+    enabled, hands over to "download_stream" instead. If "DOWNLOAD_PBF" is enabled,
+    tries "download_pbf" first, continuing with ESRI JSON if the server does not
+    support PBF.
+
+    However the layer was downloaded, the saved GeoPackage must have as many features
+    as the server reported for the layer, so that a server returning fewer features
+    than requested never results in a layer which is silently incomplete.
+
+    If the function is unable to download a layer, it is likely that a network error
+    has occured. The RuntimeError will trigger tenacity to retry the function again from
+    the start, resuming from any checkpointed pages.
+
+    Args:
+        iso3: A valid ISO 3166-1 alpha-3 code.
+        lvl: Admin level of the layer.
+        idx: Index the layer is available at on the ArcGIS Feature Service.
+        url: Base URL of an ArcGIS Feature Service.
+        state: State of the layer from "src.download.manifest.get_state".
+
+    Raises:
+        RuntimeError: Raises an error with the filename of a layer unable to be
+        downloaded.
+    """
+    filename = f"{iso3}_adm{lvl}".lower()
+    if DOWNLOAD_STREAM:
+        await download_stream(iso3, lvl, idx, url, state)
+    elif not DOWNLOAD_PBF or not await download_pbf(iso3, lvl, idx, url, state):
+        await download_json(iso3, lvl, idx, url, state)
+    if not await to_thread(is_complete, filename, state["count"]):
+        raise RuntimeError(filename)
+
+
+async def download_all(metadata: list[dict[str, Any]]) -> None:
+    """Downloads many layers at the same time.
+
+    Every layer is scheduled as a task up front. A global semaphore limits how many
+    layers are downloaded at once ("DOWNLOAD_CONCURRENCY"), and a semaphore for each
+    host limits how many of those are sent to the same server
+    ("DOWNLOAD_CONCURRENCY_HOST"), so that a single ArcGIS server is not overloaded.
+    Layers which have not changed on the server since they were last downloaded are
+    skipped, and the queries of other layers are cached by their date of last edit
+    (see "src.cache.versioned"), so that an edited layer is never saved from responses
+    cached before the edit. All requests share a single pooled client, which is closed
+    once every layer has been downloaded.
+
+    Telemetry of every layer is recorded as it is downloaded (see "src.download.stats")
+    and saved to "download_stats.csv" at the end of the run, including when the run
+    fails part way.
+
+    Args:
+        metadata: List of rows containing the ISO-3 code, admin level, layer index and
+        URL of each layer to download.
+    """
+    limit_global = Semaphore(DOWNLOAD_CONCURRENCY)
+    limit_host = defaultdict(lambda: Semaphore(DOWNLOAD_CONCURRENCY_HOST))
+
+    async def download_row(row: dict[str, Any]) -> dict[str, Any]:
+        iso3 = row["iso3"]
+        lvl = row["admin_level"]
+        url = row["itos_url"]
+        idx = row[f"itos_index_{lvl}"]
+        filename = f"{iso3}_adm{lvl}".lower()
+        async with limit_global, limit_host[urlparse(url).netloc]:
+            layer_stats = stats.start_layer(iso3, lvl)
+            state = await to_thread(manifest.get_state, url, idx)
+            if await to_thread(manifest.is_unchanged, filename, state):
+                return stats.finish_layer(layer_stats, "unchanged")
+            with cache.versioned(state["last_edit_date"]):
+                await download(iso3, lvl, idx, url, state)
+            await to_thread(manifest.save_manifest, filename, state)
+            return stats.finish_layer(layer_stats, "downloaded")
+
+    tasks = [download_row(row) for row in metadata]
+    rows = []
+    pbar = tqdm(total=len(tasks))
+    try:
+        for task in as_completed(tasks):
+            layer_stats = await task
+            rows.append(layer_stats)
+            pbar.set_postfix_str(
+                f"{layer_stats['iso3']}_ADM{layer_stats['admin_level']}",
+            )
+            pbar.update()
+    finally:
+        pbar.close()
+        await close_async_client()
+        await to_thread(stats.save_stats, rows)
@@ -0,0 +1,111 @@
+from hashlib import sha256
+from json import dump, load
+from pathlib import Path
+from typing import Any
+
+from src import cache
+from src.config import DOWNLOAD_FORCE, TIMEOUT, boundaries_dir
+from src.utils import client_get
+
+from .httpx import get_layer_count
+
+
+def get_layer_info(url: str, idx: int) -> tuple[str, dict[str, Any]]:
+    """Gets a URL describing a layer of an ArcGIS Feature Service.
+
+    The query parameter "f" (format) is set to return JSON (default is HTML). The
+    result includes "editingInfo", containing "lastEditDate" as a timestamp in
+    milliseconds if the service tracks edits, and "supportedQueryFormats", a comma
+    separated list of the formats queries can be returned in.
+
+    Args:
+        url: Base URL of an ArcGIS Feature Service.
+        idx: Index of a feature service layer.
+
+    Returns:
+        URL and query parameters which return the layer description.
+    """
+    return f"{url}/{idx}", {"f": "json"}
+
+
+def get_state(url: str, idx: int) -> dict[str, Any]:
+    """Gets the current state of a layer on the ArcGIS server.
+
+    Requests bypass the HTTP cache, as a cached state would hide edits to the layer.
+
+    Args:
+        url: Base URL of an ArcGIS Feature Service.
+        idx: Index of a feature service layer.
+
+    Returns:
+        Dict with the URL, index, date of last edit and feature count of the layer,
+        and whether its queries can be returned as PBF.
+    """
+    info_url, info_query = get_layer_info(url, idx)
+    count_url, count_query = get_layer_count(url, idx)
+    with cache.bypassed():
+        info = client_get(info_url, TIMEOUT, info_query).json()
+        count = client_get(count_url, TIMEOUT, count_query).json()["count"]
+    return {
+        "url": url,
+        "idx": int(idx),
+        "last_edit_date": info.get("editingInfo", {}).get("lastEditDate"),
+        "count": count,
+        "pbf": "pbf" in info.get("supportedQueryFormats", "").lower(),
+    }
+
+
+def get_hash(file: Path) -> str:
+    """Gets the SHA-256 hash of a file, reading it in chunks to limit memory use.
+
+    Args:
+        file: Path of the file to hash.
+
+    Returns:
+        Hexadecimal digest of the file contents.
+    """
+    digest = sha256()
+    with Path.open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_unchanged(filename: str, state: dict[str, Any]) -> bool:
+    """Checks whether a downloaded layer still matches the layer on the server.
+
+    A layer is unchanged if the server reports the same date of last edit and feature
+    count as when it was downloaded, and the GeoPackage on disk has not been modified
+    since. Layers without a date of last edit are always downloaded again, as edits
+    which keep the same feature count would not be detected. Setting "DOWNLOAD_FORCE"
+    downloads every layer regardless.
+
+    Args:
+        filename: File name of the layer.
+        state: Current state of the layer from "get_state".
+
+    Returns:
+        True if the layer can be skipped.
+    """
+    file = boundaries_dir / f"{filename}.gpkg"
+    manifest = boundaries_dir / f"{filename}.manifest.json"
+    if DOWNLOAD_FORCE or state["last_edit_date"] is None:
+        return False
+    if not file.is_file() or not manifest.is_file():
+        return False
+    with Path.open(manifest) as f:
+        saved = load(f)
+    return saved["state"] == state and saved["sha256"] == get_hash(file)
+
+
+def save_manifest(filename: str, state: dict[str, Any]) -> None:
+    """Saves the manifest of a downloaded layer next to its GeoPackage.
+
+    Args:
+        filename: File name of the layer.
+        state: State of the layer from "get_state", obtained before downloading.
+    """
+    file = boundaries_dir / f"{filename}.gpkg"
+    manifest = boundaries_dir / f"{filename}.manifest.json"
+    with Path.open(manifest, "w") as f:
+        dump({"state": state, "sha256": get_hash(file)}, f, indent=2)
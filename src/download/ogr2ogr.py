@@ -1,12 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
 from logging import getLogger
 from pathlib import Path
-from re import compile
 from subprocess import DEVNULL, CompletedProcess, run
-from urllib.parse import urlencode
+from threading import Semaphore
+from typing import Any
+from urllib.parse import urlencode, urlparse
 
+from pyogrio import read_info
+from pyogrio.errors import DataSourceError
 from tenacity import retry, stop_after_attempt, wait_fixed
+from tqdm import tqdm
 
-from src.config import ATTEMPT, WAIT, boundaries_dir
+from src.config import (
+    ATTEMPT,
+    DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_CONCURRENCY_HOST,
+    PAGE_RECORDS_MAX,
+    WAIT,
+    boundaries_dir,
+)
+
+from . import checkpoint, manifest, stats
+from .httpx import get_limit, get_records
 
 logger = getLogger(__name__)
 
@@ -16,6 +32,7 @@ def ogr2ogr(
     url: str,
     filename: str,
     records: int | None,
+    offset: int | None = None,
 ) -> CompletedProcess[bytes]:
     """Uses OGR2OGR to download ESRI JSON from an ArcGIS server to local GeoPackage.
 
@@ -33,12 +50,18 @@ def ogr2ogr(
     "FEATURE_SERVER_PAGING" is set to "YES" instructing the command to paginate through
     the server and not stop with the first query result.
 
+    If an offset is given, only a single page starting from "resultOffset" is
+    downloaded instead. The page is written to a partial GeoPackage, overwriting it for
+    the first page and appending to it for all others.
+
     Args:
         idx: Index the layer is available at on the ArcGIS Feature Service.
         url: Base URL of an ArcGIS Feature Service.
         filename: Name of the downloaded layer.
         records: The number of records to fetch from the server per request during
         pagination.
+        offset: For pagination, skips the specified number of records and starts from
+        the next record.
 
     Returns:
         A subprocess completed process, including a returncode stating whether the run
@@ -53,13 +76,17 @@ def ogr2ogr(
     if records is not None:
         query["resultRecordCount"] = records
     dst_dataset = boundaries_dir / f"{filename}.gpkg"
+    options = ["-overwrite", "-oo", "FEATURE_SERVER_PAGING=YES"]
+    if offset is not None:
+        query["resultOffset"] = offset
+        dst_dataset = checkpoint.get_partial_file(filename)
+        options = ["-append" if offset > 0 else "-overwrite"]
     src_dataset = f"{url}/{idx}/query?{urlencode(query)}"
     return run(
         [
             "ogr2ogr",
-            "-overwrite",
+            *options,
             *["-nln", filename],
-            *["-oo", "FEATURE_SERVER_PAGING=YES"],
             *[dst_dataset, src_dataset],
         ],
         stderr=DEVNULL,
@@ -71,51 +98,191 @@ def is_polygon(file: Path) -> bool:
     """Uses OGR to check whether a downloaded file is a valid polygon.
 
     During the download process, the ArcGIS server may return empty geometry. This check
-    ensures data has been downloaded correctly.
+    ensures data has been downloaded correctly. The layer metadata is read in-process
+    with pyogrio, rather than parsing the output of a separate "ogrinfo" process.
+
+    Args:
+        file: Path of a OGR readable file.
+
+    Returns:
+        True if the file is detected as a valid polygon with features, otherwise false.
+    """
+    try:
+        info = read_info(file)
+    except DataSourceError:
+        return False
+    return info["geometry_type"] in ["Polygon", "MultiPolygon"] and info["features"] > 0
+
+
+def get_count(file: Path) -> int:
+    """Uses OGR to count the features in a downloaded file.
 
     Args:
         file: Path of a OGR readable file.
 
     Returns:
-        True if the file is detected as a valid polygon, otherwise false.
+        Number of features in the file, or 0 if it cannot be read.
+    """
+    try:
+        return read_info(file)["features"]
+    except DataSourceError:
+        return 0
+
+
+def ogr2ogr_pages(idx: int, url: str, filename: str, state: dict[str, Any]) -> None:
+    """Uses OGR2OGR to download a layer one page at a time with adaptive page sizes.
+
+    Pages start with "1000" records and adapt their size around offsets where the
+    server returns an error, in the same way as "src.download.httpx_async.iter_pages".
+    Pages which succeed are kept in a partial GeoPackage, which is moved into place once
+    every page has been downloaded.
+
+    Servers return at most "maxRecordCount" features for a query, which may be fewer
+    than requested, so the offset of the next page is the number of features in the
+    partial GeoPackage rather than the number of records requested.
+
+    As the offset is always read back from the partial GeoPackage (see
+    "src.download.checkpoint.get_offset"), a retry, or a later run after a crash, keeps
+    appending from the last page that was written rather than starting again from the
+    first, and a crash between two pages can never duplicate or skip one. The partial
+    GeoPackage is discarded if the layer has been edited since it was started.
+
+    Args:
+        idx: Index the layer is available at on the ArcGIS Feature Service.
+        url: Base URL of an ArcGIS Feature Service.
+        filename: Name of the downloaded layer.
+        state: State of the layer from "src.download.manifest.get_state", including
+        its number of features.
+
+    Raises:
+        RuntimeError: Raises an error with the filename if a single record cannot be
+        downloaded, or if a page returns no features.
     """
-    regex = compile(r"\((Multi Polygon|Polygon)\)")
-    result = run(["ogrinfo", file], capture_output=True, check=False)
-    return bool(regex.search(result.stdout.decode("utf-8")))
+    count = state["count"]
+    checkpoint.load_checkpoint(filename, state)
+    records = PAGE_RECORDS_MAX
+    limit = None
+    end = 0
+    while (offset := checkpoint.get_offset(filename)) < count:
+        requested = min(records, count - offset)
+        if ogr2ogr(idx, url, filename, requested, offset).returncode != 0:
+            if requested == 1:
+                raise RuntimeError(filename)
+            stats.record_page_error()
+            limit, end = get_limit(limit, requested, offset)
+            records = get_records(requested, limit, error=True)
+            continue
+        received = checkpoint.get_offset(filename) - offset
+        if received <= 0:
+            raise RuntimeError(filename)
+        stats.record_page(received)
+        if offset + received >= end:
+            limit = None
+        records = get_records(received, limit, error=False)
+    checkpoint.get_partial_file(filename).replace(boundaries_dir / f"{filename}.gpkg")
+    checkpoint.clear(filename)
 
 
-@retry(stop=stop_after_attempt(ATTEMPT), wait=wait_fixed(WAIT))
-def download(iso3: str, lvl: int, idx: int, url: str) -> None:
+@retry(
+    stop=stop_after_attempt(ATTEMPT),
+    wait=wait_fixed(WAIT),
+    before_sleep=stats.record_retry,
+)
+def download(iso3: str, lvl: int, idx: int, url: str, state: dict[str, Any]) -> None:
     """Downloads ESRI JSON from an ArcGIS Feature Server and saves as GeoPackage.
 
     First, attempts to download ESRI JSON paginating through the layer with the value
     set by "maxRecordCount" (default behavior when "resultRecordCount" is unspecified).
     This request may fail due to memory issues on the server.
 
-    Then, starting with "1000" and reducing by factors of "10", try to paginate through
-    the layer. "1000" is a value that will succeed for most layers, however layers with
+    Then, paginate through the layer one page at a time, starting with "1000" records.
+    "1000" is a value that will succeed for most layers, however layers with
     excessively large geometries will require smaller sets of records to avoid
-    overloading the server's memory. When all records have been obtained through
-    pagination, save the result.
+    overloading the server's memory. Page sizes are only reduced around the offsets
+    which fail, and grow again afterwards (see "ogr2ogr_pages").
+
+    The saved GeoPackage must have as many features as the server reported for the
+    layer, so that a layer which is silently incomplete is never kept. If the first
+    attempt saved fewer features, the layer is paginated instead.
 
-    If at the end of this loop, the function is unable to download a layer, it is likely
-    that a network error has occured. The RuntimeError will trigger tenacity to retry
-    the function again from the start.
+    If the function is unable to download a layer, it is likely that a network error
+    has occured. The RuntimeError will trigger tenacity to retry the function again from
+    the start. If paging had already begun, the retry skips the first attempt and
+    resumes paging from its checkpoint.
 
     Args:
         iso3: A valid ISO 3166-1 alpha-3 code.
         lvl: Admin level of the layer.
         idx: Index the layer is available at on the ArcGIS Feature Service.
         url: Base URL of an ArcGIS Feature Service.
+        state: State of the layer from "src.download.manifest.get_state".
 
     Raises:
         RuntimeError: Raises an error with the filename of a layer unable to be
         downloaded.
     """
     filename = f"{iso3}_adm{lvl}".lower()
-    for records in [None, 1000, 100, 10, 1]:
-        result = ogr2ogr(idx, url, filename, records)
-        if result.returncode == 0:
-            break
-    if not is_polygon(boundaries_dir / f"{filename}.gpkg"):
+    file = boundaries_dir / f"{filename}.gpkg"
+    if (
+        checkpoint.exists(filename)
+        or ogr2ogr(idx, url, filename, None).returncode != 0
+        or get_count(file) != state["count"]
+    ):
+        ogr2ogr_pages(idx, url, filename, state)
+    if not is_polygon(file) or get_count(file) != state["count"]:
         raise RuntimeError(filename)
+
+
+def download_all(metadata: list[dict[str, Any]]) -> None:
+    """Downloads many layers at the same time with OGR2OGR.
+
+    Each OGR2OGR process spends most of its time waiting on the network, so layers are
+    downloaded in a pool of threads each running its own process. The pool size limits
+    how many layers are downloaded at once ("DOWNLOAD_CONCURRENCY"), and a semaphore
+    for each host limits how many of those are sent to the same server
+    ("DOWNLOAD_CONCURRENCY_HOST"). Semaphores are created for every host before any
+    thread starts, and the pool is never larger than all hosts together allow, so that
+    threads are not left waiting on a host. Layers which have not changed on the server
+    since they were last downloaded are skipped. Telemetry of every layer is saved in
+    the same way as "src.download.httpx_async.download_all".
+
+    Args:
+        metadata: List of rows containing the ISO-3 code, admin level, layer index and
+        URL of each layer to download.
+    """
+    hosts = {urlparse(row["itos_url"]).netloc for row in metadata}
+    limit_host = {x: Semaphore(DOWNLOAD_CONCURRENCY_HOST) for x in hosts}
+    workers = max(1, min(DOWNLOAD_CONCURRENCY, len(hosts) * DOWNLOAD_CONCURRENCY_HOST))
+
+    def download_row(row: dict[str, Any]) -> dict[str, Any]:
+        iso3 = row["iso3"]
+        lvl = row["admin_level"]
+        url = row["itos_url"]
+        idx = row[f"itos_index_{lvl}"]
+        filename = f"{iso3}_adm{lvl}".lower()
+        with limit_host[urlparse(url).netloc]:
+            layer_stats = stats.start_layer(iso3, lvl)
+            state = manifest.get_state(url, idx)
+            if manifest.is_unchanged(filename, state):
+                return stats.finish_layer(layer_stats, "unchanged")
+            download(iso3, lvl, idx, url, state)
+            manifest.save_manifest(filename, state)
+            return stats.finish_layer(layer_stats, "downloaded")
+
+    rows = []
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(copy_context().run, download_row, row) for row in metadata
+        ]
+        pbar = tqdm(total=len(futures))
+        try:
+            for future in as_completed(futures):
+                layer_stats = future.result()
+                rows.append(layer_stats)
+                pbar.set_postfix_str(
+                    f"{layer_stats['iso3']}_ADM{layer_stats['admin_level']}",
+                )
+                pbar.update()
+        finally:
+            pbar.close()
+            stats.save_stats(rows)
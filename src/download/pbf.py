@@ -0,0 +1,268 @@
+from itertools import pairwise
+from struct import unpack_from
+from typing import Any
+
+import numpy as np
+from geopandas import GeoDataFrame
+from pandas import to_datetime
+from shapely import LinearRing, MultiPolygon, Polygon
+
+# NOTE: Field numbers from FeatureCollection.proto of the ArcGIS Feature Service PBF
+# specification (https://github.com/Esri/arcgis-pbf).
+QUERY_RESULT = 2
+FEATURE_RESULT = 1
+FEATURE_RESULT_SPATIAL_REFERENCE = 8
+FEATURE_RESULT_EXCEEDED_TRANSFER_LIMIT = 9
+FEATURE_RESULT_TRANSFORM = 12
+FEATURE_RESULT_FIELDS = 13
+FEATURE_RESULT_FEATURES = 15
+FEATURE_ATTRIBUTES = 1
+FEATURE_GEOMETRY = 2
+FIELD_TYPE_DATE = 5
+QUANTIZE_ORIGIN_UPPER_LEFT = 0
+
+VARINT_CONTINUATION = 0x80
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH = 2
+WIRE_FIXED32 = 5
+
+type Message = dict[int, list[Any]]
+
+
+def read_varint(buffer: memoryview, pos: int) -> tuple[int, int]:
+    """Reads a single protobuf varint.
+
+    Args:
+        buffer: Protobuf encoded bytes.
+        pos: Position of the first byte of the varint.
+
+    Returns:
+        The decoded integer and the position after the varint.
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < VARINT_CONTINUATION:
+            return result, pos
+        shift += 7
+
+
+def read_message(buffer: memoryview) -> Message:
+    """Reads the fields of a protobuf message without a schema.
+
+    Varints are returned as integers, fixed width values as raw bytes, and length
+    delimited values (strings, bytes, nested messages and packed arrays) as memoryviews
+    so that nested messages are only decoded when needed.
+
+    Args:
+        buffer: Protobuf encoded message.
+
+    Returns:
+        Dict of field numbers, each with a list of values in the order they appear.
+    """
+    message: Message = {}
+    pos = 0
+    while pos < len(buffer):
+        key, pos = read_varint(buffer, pos)
+        field, wire = key >> 3, key & 0x07
+        if wire == WIRE_VARINT:
+            value, pos = read_varint(buffer, pos)
+        elif wire == WIRE_FIXED64:
+            value, pos = buffer[pos : pos + 8], pos + 8
+        elif wire == WIRE_LENGTH:
+            length, pos = read_varint(buffer, pos)
+            value, pos = buffer[pos : pos + length], pos + length
+        elif wire == WIRE_FIXED32:
+            value, pos = buffer[pos : pos + 4], pos + 4
+        else:
+            raise ValueError(wire)
+        message.setdefault(field, []).append(value)
+    return message
+
+
+def read_packed(buffer: memoryview) -> np.ndarray:
+    """Reads a packed array of unsigned varints with numpy.
+
+    Every byte without the continuation bit set ends a varint, so all varints in the
+    array are decoded at once instead of one byte at a time in Python.
+
+    Args:
+        buffer: Protobuf encoded packed array.
+
+    Returns:
+        Array of unsigned 64 bit integers.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < VARINT_CONTINUATION)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+    values = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(values, starts)
+
+
+def zigzag(values: np.ndarray) -> np.ndarray:
+    """Decodes zigzag encoded signed integers (sint32 and sint64).
+
+    Args:
+        values: Array of unsigned 64 bit integers.
+
+    Returns:
+        Array of signed 64 bit integers.
+    """
+    signs = -(values & np.uint64(1)).astype(np.int64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ signs
+
+
+def read_double(message: Message, field: int, default: float) -> float:
+    """Reads a double field from a message.
+
+    Args:
+        message: Message from "read_message".
+        field: Field number.
+        default: Value used if the field is not set.
+
+    Returns:
+        Decoded double.
+    """
+    if field not in message:
+        return default
+    return unpack_from("<d", message[field][-1])[0]
+
+
+def read_value(buffer: memoryview) -> str | float | bool | None:
+    """Reads an attribute value, which may be one of many types.
+
+    Args:
+        buffer: Protobuf encoded Value message.
+
+    Returns:
+        Decoded value, or None if the value is null.
+    """
+    message = read_message(buffer)
+    if not message:
+        return None
+    field, values = next(iter(message.items()))
+    value = values[-1]
+    decoders = {
+        1: lambda x: bytes(x).decode("utf-8"),
+        2: lambda x: unpack_from("<f", x)[0],
+        3: lambda x: unpack_from("<d", x)[0],
+        4: lambda x: (x >> 1) ^ -(x & 1),
+        5: lambda x: x,
+        6: lambda x: x - (1 << 64) if x >= 1 << 63 else x,
+        7: lambda x: x,
+        8: lambda x: (x >> 1) ^ -(x & 1),
+        9: bool,
+    }
+    return decoders[field](value)
+
+
+def read_transform(message: Message) -> tuple[float, float, float, float, bool]:
+    """Reads the transform used to dequantize coordinates.
+
+    Args:
+        message: FeatureResult message from "read_message".
+
+    Returns:
+        X scale, Y scale, X translate, Y translate, and whether the origin is the upper
+        left, in which case Y values increase downwards.
+    """
+    transform = read_message(message.get(FEATURE_RESULT_TRANSFORM, [b""])[-1])
+    origin = transform.get(1, [QUANTIZE_ORIGIN_UPPER_LEFT])[-1]
+    scale = read_message(transform.get(2, [b""])[-1])
+    translate = read_message(transform.get(3, [b""])[-1])
+    return (
+        read_double(scale, 1, 1),
+        read_double(scale, 2, 1),
+        read_double(translate, 1, 0),
+        read_double(translate, 2, 0),
+        origin == QUANTIZE_ORIGIN_UPPER_LEFT,
+    )
+
+
+def read_geometry(
+    buffer: memoryview,
+    transform: tuple[float, float, float, float, bool],
+) -> Polygon | MultiPolygon | None:
+    """Reads a quantized polygon geometry.
+
+    Coordinates are delta encoded pairs of X and Y values, continuing from one ring to
+    the next, with the number of points of each ring given by "lengths". As with ESRI
+    JSON, outer rings are clockwise and holes counter-clockwise. Holes are added to the
+    outer ring which contains them.
+
+    Args:
+        buffer: Protobuf encoded Geometry message.
+        transform: Transform from "read_transform".
+
+    Returns:
+        Polygon or MultiPolygon, or None if the geometry is empty.
+    """
+    message = read_message(buffer)
+    lengths = read_packed(message.get(2, [b""])[-1]).astype(np.int64)
+    coords = zigzag(read_packed(message.get(3, [b""])[-1])).reshape(-1, 2).cumsum(0)
+    if not len(lengths):
+        return None
+    x_scale, y_scale, x_translate, y_translate, upper_left = transform
+    x = x_translate + coords[:, 0] * x_scale
+    y = y_translate + coords[:, 1] * (-y_scale if upper_left else y_scale)
+    points = np.column_stack((x, y))
+    offsets = np.concatenate(([0], lengths.cumsum()))
+    shells: list[list[Any]] = []
+    for start, stop in pairwise(offsets):
+        ring = LinearRing(points[start:stop])
+        if not ring.is_ccw or not shells:
+            shells.append([ring])
+            continue
+        shell = next((x for x in shells if Polygon(x[0]).contains(ring)), shells[-1])
+        shell.append(ring)
+    polygons = [Polygon(x[0], x[1:]) for x in shells]
+    return polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+
+
+def read_pbf(content: bytes) -> tuple[GeoDataFrame, bool]:
+    """Reads an ArcGIS Feature Service query response encoded as PBF.
+
+    Attributes are stored as a list of values in the same order as the list of fields.
+    Dates are stored as milliseconds since the UNIX epoch, and are converted to UTC
+    datetimes to match layers read from ESRI JSON.
+
+    Args:
+        content: Raw body of an ArcGIS query response requested with "f=pbf".
+
+    Returns:
+        GeoDataFrame with the features of the response, and whether the response
+        exceeded the transfer limit of the server.
+    """
+    collection = read_message(memoryview(content))
+    query_result = read_message(collection[QUERY_RESULT][-1])
+    result = read_message(query_result[FEATURE_RESULT][-1])
+    fields = [read_message(x) for x in result.get(FEATURE_RESULT_FIELDS, [])]
+    names = [bytes(x[1][-1]).decode("utf-8") for x in fields]
+    transform = read_transform(result)
+    columns: dict[str, list[Any]] = {name: [] for name in names}
+    geometry = []
+    for buffer in result.get(FEATURE_RESULT_FEATURES, []):
+        feature = read_message(buffer)
+        values = [read_value(x) for x in feature.get(FEATURE_ATTRIBUTES, [])]
+        for name, value in zip(names, values, strict=True):
+            columns[name].append(value)
+        geometry.append(
+            read_geometry(feature.get(FEATURE_GEOMETRY, [b""])[-1], transform),
+        )
+    spatial_reference = read_message(
+        result.get(FEATURE_RESULT_SPATIAL_REFERENCE, [b""])[-1],
+    )
+    wkid = spatial_reference.get(2, spatial_reference.get(1, [None]))[-1]
+    gdf = GeoDataFrame(columns, geometry=geometry, crs=wkid)
+    for field, name in zip(fields, names, strict=True):
+        if field.get(2, [None])[-1] == FIELD_TYPE_DATE:
+            gdf[name] = to_datetime(gdf[name], unit="ms", utc=True)
+    exceeded = bool(result.get(FEATURE_RESULT_EXCEEDED_TRANSFER_LIMIT, [0])[-1])
+    return gdf, exceeded
@@ -0,0 +1,160 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Any
+
+from httpx import Response
+from pandas import DataFrame, Timestamp
+from tenacity import RetryCallState
+
+from src.config import tables_dir
+
+layer_stats: ContextVar[dict[str, Any] | None] = ContextVar("layer_stats", default=None)
+lock = Lock()
+
+
+def start_layer(iso3: str, lvl: int) -> dict[str, Any]:
+    """Starts recording telemetry for a layer in the current context.
+
+    Tasks and threads started from the current context share the same record, so pages
+    fetched concurrently all count towards the layer they belong to. Threads started by
+    a ThreadPoolExecutor do not inherit the context, so they need to be submitted with
+    "contextvars.copy_context().run".
+
+    Args:
+        iso3: A valid ISO 3166-1 alpha-3 code.
+        lvl: Admin level of the layer.
+
+    Returns:
+        Dict of telemetry for the layer, updated as it is downloaded.
+    """
+    stats = {
+        "iso3": iso3,
+        "admin_level": lvl,
+        "status": "downloaded",
+        "bytes": 0,
+        "requests": 0,
+        "pages": 0,
+        "page_size": None,
+        "page_errors": 0,
+        "retries": 0,
+        "ttfb_seconds": None,
+        "latency_seconds": 0.0,
+        "parse_seconds": 0.0,
+        "start": perf_counter(),
+    }
+    layer_stats.set(stats)
+    return stats
+
+
+def finish_layer(stats: dict[str, Any], status: str) -> dict[str, Any]:
+    """Finishes recording telemetry for a layer.
+
+    Args:
+        stats: Dict of telemetry from "start_layer".
+        status: Outcome of the layer, either "downloaded" or "unchanged".
+
+    Returns:
+        Dict of telemetry for the layer, ready to be saved.
+    """
+    stats["status"] = status
+    stats["latency_seconds"] = perf_counter() - stats.pop("start")
+    return stats
+
+
+def record_response(response: Response) -> None:
+    """Records a response received while downloading a layer.
+
+    Bytes are counted as transferred over the network, before decompression. Time to
+    first byte is taken from the first response of the layer (see
+    "src.utils.get_client").
+
+    Args:
+        response: HTTP response to a request for the layer.
+    """
+    stats = layer_stats.get()
+    if stats is None:
+        return
+    with lock:
+        stats["bytes"] += response.num_bytes_downloaded
+        stats["requests"] += 1
+        if stats["ttfb_seconds"] is None:
+            stats["ttfb_seconds"] = response.extensions.get("ttfb")
+
+
+def record_page(records: int) -> None:
+    """Records a page downloaded successfully.
+
+    Args:
+        records: The number of records requested for the page.
+    """
+    stats = layer_stats.get()
+    if stats is None:
+        return
+    with lock:
+        stats["pages"] += 1
+        stats["page_size"] = records
+
+
+def record_page_error() -> None:
+    """Records a page which failed and is requested again with fewer records."""
+    stats = layer_stats.get()
+    if stats is None:
+        return
+    with lock:
+        stats["page_errors"] += 1
+
+
+def record_retry(_retry_state: RetryCallState) -> None:
+    """Records a retry, used as the "before_sleep" callback of tenacity.
+
+    Args:
+        _retry_state: State of the call being retried.
+    """
+    stats = layer_stats.get()
+    if stats is None:
+        return
+    with lock:
+        stats["retries"] += 1
+
+
+@contextmanager
+def timed(key: str) -> Iterator[None]:
+    """Adds the time spent within the context to a telemetry value of the layer.
+
+    Args:
+        key: Name of the value to add to, such as "parse_seconds".
+
+    Yields:
+        Nothing, timing the body of the "with" statement.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats = layer_stats.get()
+        if stats is not None:
+            with lock:
+                stats[key] += perf_counter() - start
+
+
+def save_stats(rows: list[dict[str, Any]]) -> None:
+    """Saves the telemetry of every layer downloaded in a run.
+
+    Each row has the bytes transferred over the network, number of requests, number of
+    pages paginated through (0 if the layer was downloaded in a single request), size
+    of the last page, pages which failed and were requested again with fewer records,
+    retries of requests and of the whole layer, time to first byte of the first
+    request, total latency, and time spent parsing responses. Columns which cannot be
+    measured, such as bytes transferred by OGR2OGR, are left at their defaults.
+
+    Args:
+        rows: List of dicts of telemetry from "finish_layer".
+    """
+    if not rows:
+        return
+    df_stats = DataFrame(rows).sort_values(["iso3", "admin_level"])
+    df_stats.insert(0, "date", Timestamp.now(tz="UTC").floor("s"))
+    df_stats.to_csv(tables_dir / "download_stats.csv", index=False)
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from logging import getLogger
 from typing import Any
 
@@ -5,20 +6,52 @@ from hdx.location.country import Country
 from pandas import DataFrame
 from tqdm import tqdm
 
-from src.config import metadata_columns, tables_dir
+from src.config import METADATA_CONCURRENCY, metadata_columns, tables_dir
 from src.utils import get_iso3
 
-from .getters import get_hdx_metadata, get_itos_metadata
+from .getters import (
+    get_hdx_metadata,
+    get_hdx_packages,
+    get_itos_metadata,
+    get_services,
+)
 from .join import join_hdx_metadata, join_itos_metadata
 
 logger = getLogger(__name__)
 
 
+def add_metadata(
+    row: dict[str, Any],
+    packages: dict[str, dict[str, Any]],
+    services: dict[str, str],
+) -> str:
+    """Adds metadata from HDX and ITOS to a location.
+
+    Args:
+        row: Country config dict, updated in place.
+        packages: Index of HDX datasets from "get_hdx_packages".
+        services: Index of ITOS services from "get_services".
+
+    Returns:
+        ISO-3 code of the location.
+    """
+    hdx = get_hdx_metadata(row["iso3"], packages)
+    if hdx is not None:
+        row.update(join_hdx_metadata(hdx))
+    itos = get_itos_metadata(row["iso3"], services)
+    if itos is not None:
+        row.update(join_itos_metadata(itos))
+    return row["iso3"]
+
+
 def get_metadata() -> list[dict[str, Any]]:
     """Gets metadata for all 249 ISO 3166 country codes.
 
     Iterates through each location in HDX countries and adds metadata about those
-    locations from HDX and ITOS.
+    locations from HDX and ITOS. HDX datasets and ITOS services are listed once up
+    front, so that only locations with a service are requested from ITOS. Each location
+    needs several requests which mostly wait on the network, so locations are requested
+    in a pool of threads, with up to "METADATA_CONCURRENCY" at the same time.
 
     Returns:
         A list of country config dicts from HDX countries with additional metadata from
@@ -37,15 +70,17 @@ def get_metadata() -> list[dict[str, Any]]:
     if len(iso3_list):
         metadata = [x for x in metadata if x["iso3"] in iso3_list]
     metadata.sort(key=lambda x: x["iso3"])
-    pbar = tqdm(metadata)
-    for row in pbar:
-        pbar.set_postfix_str(row["iso3"])
-        hdx = get_hdx_metadata(row["iso3"])
-        if hdx is not None:
-            row.update(join_hdx_metadata(hdx))
-        itos = get_itos_metadata(row["iso3"])
-        if itos is not None:
-            row.update(join_itos_metadata(itos))
+    packages = get_hdx_packages()
+    services = get_services()
+    with ThreadPoolExecutor(METADATA_CONCURRENCY) as executor:
+        futures = [
+            executor.submit(add_metadata, row, packages, services) for row in metadata
+        ]
+        pbar = tqdm(total=len(futures))
+        for future in as_completed(futures):
+            pbar.set_postfix_str(future.result())
+            pbar.update()
+        pbar.close()
     return metadata
 
 
@@ -4,8 +4,43 @@ from typing import Any, Literal
 from src.config import TIMEOUT
 from src.utils import client_get
 
+HDX_URL = "https://data.humdata.org/api/3/action"
+HDX_ROWS = 1000
+ITOS_URL = "https://codgis.itos.uga.edu/arcgis/rest/services"
+ITOS_DIRECTORIES = ("COD_External", "COD_NO_GEOM_CHECK")
 
-def get_hdx_metadata(iso3: str) -> dict[str, Any]:
+
+def get_hdx_packages() -> dict[str, dict[str, Any]]:
+    """Gets an index of every COD-AB dataset on HDX.
+
+    Searches for datasets named "cod-ab-*" in pages of up to 1,000, instead of
+    requesting each location's dataset on its own, which would take one request for
+    every ISO 3166 country code.
+
+    Returns:
+        A dict where each key is an ISO 3166-1 alpha-3 code, and each value the package
+        of metadata describing its COD on HDX.
+    """
+    p = compile(r"^cod-ab-(?P<iso3>[a-z]{3})$")
+    packages = {}
+    start = 0
+    while True:
+        params = {"fq": "name:cod-ab-*", "rows": HDX_ROWS, "start": start}
+        url = f"{HDX_URL}/package_search"
+        result = client_get(url, TIMEOUT, params).json()["result"]
+        for package in result["results"]:
+            match = p.match(package["name"])
+            if match:
+                packages[match["iso3"].upper()] = package
+        start += HDX_ROWS
+        if not result["results"] or start >= result["count"]:
+            return packages
+
+
+def get_hdx_metadata(
+    iso3: str,
+    packages: dict[str, dict[str, Any]],
+) -> dict[str, Any] | None:
     """Get HDX metadata associated with a COD on HDX.
 
     This is useful for accessing information such as what license does this data fall
@@ -14,14 +49,13 @@ def get_hdx_metadata(iso3: str) -> dict[str, Any]:
 
     Args:
         iso3: A valid ISO 3166-1 alpha-3 code.
+        packages: Index of datasets from "get_hdx_packages".
 
     Returns:
-        A complete package of metadata describing the COD resource on HDX.
+        A complete package of metadata describing the COD resource on HDX, or None if
+        the location does not have one.
     """
-    url = "https://data.humdata.org/api/3/action/package_show"
-    params = {"id": f"cod-ab-{iso3.lower()}"}
-    result: dict = client_get(url, TIMEOUT, params).json().get("result")
-    return result
+    return packages.get(iso3)
 
 
 def get_service_url(directory: str, iso3: str) -> str:
@@ -34,33 +68,54 @@ def get_service_url(directory: str, iso3: str) -> str:
     Returns:
         The URL for a COD's ArcGIS Feature Service.
     """
-    base = "https://codgis.itos.uga.edu/arcgis/rest/services"
-    return f"{base}/{directory}/{iso3}_pcode/FeatureServer"
+    return f"{ITOS_URL}/{directory}/{iso3}_pcode/FeatureServer"
+
+
+def get_services() -> dict[str, str]:
+    """Gets an index of every COD Feature Service available on the ITOS server.
+
+    Lists each service directory once, instead of probing every location for a
+    service which may not exist. Services named "{ISO3}_pcode" are kept, preferring
+    COD_External where a location is found in both directories.
+
+    Returns:
+        A dict where each key is an ISO 3166-1 alpha-3 code, and each value the
+        service directory it belongs to.
+    """
+    p = compile(r"^(?P<iso3>[A-Z]{3})_pcode$")
+    services = {}
+    for directory in ITOS_DIRECTORIES:
+        folder = client_get(f"{ITOS_URL}/{directory}", TIMEOUT, {"f": "json"}).json()
+        for service in folder.get("services", []):
+            match = p.match(service["name"].split("/")[-1])
+            if match and service["type"] == "FeatureServer":
+                services.setdefault(match["iso3"], directory)
+    return services
 
 
 def get_service(
     iso3: str,
+    services: dict[str, str],
 ) -> tuple[Any | None, Literal["COD_NO_GEOM_CHECK", "COD_External"], str]:
     """Gets key metadata about a COD from the ITOS ArcGIS server.
 
+    Only locations found in the index of services are requested, and the layers of a
+    service are described in a single request to its "layers" resource.
+
     Args:
         iso3: A valid ISO 3166-1 alpha-3 code.
+        services: Index of services from "get_services".
 
     Returns:
         Metadata about a COD, including the list of layers available for a location,
         which service directory it belongs to, and the URL of the service.
     """
-    params = {"f": "json"}
-    directory = "COD_External"
+    directory = services.get(iso3, "COD_External")
     url = get_service_url(directory, iso3)
-    service = client_get(url, TIMEOUT, params).json()
-    if "error" in service:
-        directory = "COD_NO_GEOM_CHECK"
-        url = get_service_url(directory, iso3)
-        service = client_get(url, TIMEOUT, params).json()
-        if "error" in service:
-            service = {"layers": None}
-    return service["layers"], directory, url.split("?")[0]
+    if iso3 not in services:
+        return None, directory, url
+    service = client_get(f"{url}/layers", TIMEOUT, {"f": "json"}).json()
+    return service.get("layers"), directory, url
 
 
 def get_layer_indexes(layers: list[dict[str, Any]]) -> dict[str, Any]:
@@ -90,16 +145,17 @@ def get_layer_indexes(layers: list[dict[str, Any]]) -> dict[str, Any]:
     return indexes
 
 
-def get_itos_metadata(iso3: str) -> dict[str, Any] | None:
+def get_itos_metadata(iso3: str, services: dict[str, str]) -> dict[str, Any] | None:
     """Gets COD metadata from the ITOS ArcGIS server if it exists there.
 
     Args:
         iso3: A valid ISO 3166-1 alpha-3 code.
+        services: Index of services from "get_services".
 
     Returns:
         Metadata that can be used to download CODs from the ITOS ArcGIS server.
     """
-    layers, directory, url = get_service(iso3)
+    layers, directory, url = get_service(iso3, services)
     if layers is None:
         return None
     indexes = get_layer_indexes(layers)
@@ -9,7 +9,7 @@ def join_hdx_metadata(hdx: dict) -> dict[str, Any]:
     """Returns new properties for contry config from HDX.
 
     Args:
-        hdx: HDX metadata from https://data.humdata.org/api/3/action/package_show.
+        hdx: HDX metadata from https://data.humdata.org/api/3/action/package_search.
 
     Returns:
         Country config supplemented with extra properties.
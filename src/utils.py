@@ -1,15 +1,30 @@
 from argparse import ArgumentParser, Namespace
+from asyncio import AbstractEventLoop, get_running_loop, to_thread
+from atexit import register
 from collections.abc import Hashable
 from os import getenv
 from pathlib import Path
+from threading import Lock
+from time import perf_counter
 from typing import Any, Literal
+from weakref import WeakKeyDictionary
 
 import pandas as pd
-from httpx import Client, Response
+from httpx import AsyncClient, Client, Limits, Request, Response
 from pandas import DataFrame, to_datetime
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import (
+    retry,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_fixed,
+)
 
-from .config import ATTEMPT, WAIT, tables_dir
+from . import cache
+from .config import ATTEMPT, HTTP_MAX_CONNECTIONS, WAIT, tables_dir
+
+clients: dict[str, Client] = {}
+clients_lock = Lock()
+async_clients: WeakKeyDictionary[AbstractEventLoop, AsyncClient] = WeakKeyDictionary()
 
 
 def parse_args(argv: list[str] | None = None) -> Namespace:
@@ -37,10 +52,128 @@ def parse_args(argv: list[str] | None = None) -> Namespace:
     return parser.parse_args(argv)
 
 
-@retry(stop=stop_after_attempt(ATTEMPT), wait=wait_fixed(WAIT))
+def get_limits() -> Limits:
+    """Gets connection pool limits shared by HTTP clients.
+
+    Connections are kept alive up to the same limit as the total number of connections,
+    so that concurrent requests to the same server reuse connections rather than paying
+    for a new TCP, TLS and HTTP/2 handshake each time.
+
+    Returns:
+        HTTPX connection pool limits.
+    """
+    return Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+    )
+
+
+def set_request_start(request: Request) -> None:
+    """Records when a request is sent, as an event hook of HTTP clients.
+
+    Args:
+        request: HTTP request about to be sent.
+    """
+    request.extensions["start"] = perf_counter()
+
+
+def set_response_ttfb(response: Response) -> None:
+    """Records the time to first byte of a response, as an event hook of HTTP clients.
+
+    Response hooks are called once the headers have arrived, before the body is read,
+    so the time since the request was sent is the time to first byte. It is stored as
+    "ttfb" in the extensions of the response.
+
+    Args:
+        response: HTTP response whose body has not been read yet.
+    """
+    start = response.request.extensions.get("start", perf_counter())
+    response.extensions["ttfb"] = perf_counter() - start
+
+
+async def async_set_request_start(request: Request) -> None:
+    """Asynchronous version of "set_request_start".
+
+    Args:
+        request: HTTP request about to be sent.
+    """
+    set_request_start(request)
+
+
+async def async_set_response_ttfb(response: Response) -> None:
+    """Asynchronous version of "set_response_ttfb".
+
+    Args:
+        response: HTTP response whose body has not been read yet.
+    """
+    set_response_ttfb(response)
+
+
+def get_client() -> Client:
+    """Gets the HTTP/2 client shared by the whole process.
+
+    The client is created on first use, and closed when the interpreter exits. HTTPX
+    clients are thread safe, so the same connection pool is used by every thread.
+
+    Returns:
+        HTTPX client with connection pooling, keep-alive and HTTP/2 multiplexing.
+    """
+    with clients_lock:
+        if "client" not in clients:
+            client = Client(
+                http2=True,
+                limits=get_limits(),
+                event_hooks={
+                    "request": [set_request_start],
+                    "response": [set_response_ttfb],
+                },
+            )
+            register(client.close)
+            clients["client"] = client
+        return clients["client"]
+
+
+def get_async_client() -> AsyncClient:
+    """Gets the asynchronous HTTP/2 client shared by the running event loop.
+
+    Asynchronous connections belong to the event loop they were opened in, so one
+    client is kept for each loop. Callers running an event loop are responsible for
+    closing it with "close_async_client" before the loop finishes.
+
+    Returns:
+        HTTPX async client with connection pooling, keep-alive and HTTP/2 multiplexing.
+    """
+    loop = get_running_loop()
+    if loop not in async_clients:
+        async_clients[loop] = AsyncClient(
+            http2=True,
+            limits=get_limits(),
+            event_hooks={
+                "request": [async_set_request_start],
+                "response": [async_set_response_ttfb],
+            },
+        )
+    return async_clients[loop]
+
+
+async def close_async_client() -> None:
+    """Closes the asynchronous HTTP/2 client of the running event loop, if any."""
+    client = async_clients.pop(get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+@retry(
+    retry=retry_if_not_exception_type(FileNotFoundError),
+    stop=stop_after_attempt(ATTEMPT),
+    wait=wait_fixed(WAIT),
+)
 def client_get(url: str, timeout: int, params: dict | None = None) -> Response:
     """HTTP GET with retries, waiting, and longer timeouts.
 
+    If "HTTP_CACHE" is set, responses are kept on disk (see "src.cache"), and fresh
+    ones are returned without sending the request again.
+
     Args:
         url: A valid URL.
         timeout: Amount in seconds to wait between retries.
@@ -48,9 +181,58 @@ def client_get(url: str, timeout: int, params: dict | None = None) -> Response:
 
     Returns:
         HTTP response.
+
+    Raises:
+        FileNotFoundError: Raises an error without retrying if "HTTP_CACHE_OFFLINE" is
+        set and the response has not been cached.
+    """
+    key, entry, cached = cache.get_cached(url, params)
+    if cached is not None:
+        return cached
+    headers = cache.get_headers(entry)
+    response = get_client().get(url, params=params, headers=headers, timeout=timeout)
+    return cache.update(key, entry, response)
+
+
+@retry(
+    retry=retry_if_not_exception_type(FileNotFoundError),
+    stop=stop_after_attempt(ATTEMPT),
+    wait=wait_fixed(WAIT),
+)
+async def async_client_get(
+    url: str,
+    timeout_seconds: int,
+    params: dict | None = None,
+) -> Response:
+    """Asynchronous HTTP GET with retries, waiting, and longer timeouts.
+
+    Uses the same cache of responses as "client_get", read and written from a thread
+    so that disk access does not block the event loop.
+
+    Args:
+        url: A valid URL.
+        timeout_seconds: Amount in seconds to wait between retries.
+        params: Optional URL query parameters included in the request.
+
+    Returns:
+        HTTP response.
+
+    Raises:
+        FileNotFoundError: Raises an error without retrying if "HTTP_CACHE_OFFLINE" is
+        set and the response has not been cached.
     """
-    with Client(http2=True, timeout=timeout) as client:
-        return client.get(url, params=params)
+    key, entry, cached = await to_thread(cache.get_cached, url, params)
+    if cached is not None:
+        return cached
+    client = get_async_client()
+    headers = cache.get_headers(entry)
+    response = await client.get(
+        url,
+        params=params,
+        headers=headers,
+        timeout=timeout_seconds,
+    )
+    return await to_thread(cache.update, key, entry, response)
 
 
 def read_csv(file_path: Path | str, *, datetime_to_date: bool = False) -> DataFrame:
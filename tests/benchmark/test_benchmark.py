@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import pytest
+from geopandas import read_file
+
+from src.benchmark import __main__ as benchmark
+
+
+def test_verify(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(benchmark, "boundaries_dir", tmp_path)
+    gdf = read_file("tests/test_data/mdg_adm0.gpkg").explode(ignore_index=True)
+    gdf.to_file(tmp_path / "xaa_adm0.gpkg")
+    metadata = [
+        {"iso3": "XAA", "admin_level": 0},
+        {"iso3": "XAB", "admin_level": 0},
+    ]
+    layer = {"features": [{}] * len(gdf)}
+    benchmark.verify(metadata[:1], {"XAA": {0: layer}})
+    with pytest.raises(RuntimeError, match="xaa_adm0"):
+        benchmark.verify(metadata[:1], {"XAA": {0: {"features": [{}] * 90}}})
+    with pytest.raises(RuntimeError, match="xab_adm0"):
+        benchmark.verify(metadata, {"XAA": {0: layer}, "XAB": {0: layer}})
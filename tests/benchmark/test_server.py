@@ -0,0 +1,36 @@
+from pathlib import Path
+from threading import Lock
+
+from src.benchmark.server import query_layer, read_layer
+
+
+def test_query_layer() -> None:
+    layer = read_layer(Path("tests/test_data/mdg_adm0.gpkg"))
+    count = len(layer["features"])
+    options = {
+        "error_rate": 0,
+        "error_records": 10,
+        "max_record_count": 5,
+        "error_ids": {50},
+        "lock": Lock(),
+        "queries": 0,
+    }
+    assert query_layer(layer, {"returnCountOnly": "true"}, options) == {"count": count}
+    ids = query_layer(layer, {"returnIdsOnly": "true"}, options)["objectIds"]
+    assert ids == list(range(1, count + 1))
+    page = query_layer(layer, {"f": "json", "resultOffset": "2"}, options)
+    assert [x["attributes"]["OBJECTID"] for x in page["features"]] == [3, 4, 5, 6, 7]
+    assert page["exceededTransferLimit"]
+    where = {"f": "json", "where": "OBJECTID BETWEEN 2 AND 3"}
+    page = query_layer(layer, where, options)
+    assert [x["attributes"]["OBJECTID"] for x in page["features"]] == [2, 3]
+    assert "exceededTransferLimit" not in page
+    errors = {**options, "error_records": 3}
+    assert "error" in query_layer(layer, {"f": "json"}, errors)
+    between = {**where, "resultRecordCount": "5"}
+    assert "error" not in query_layer(layer, between, errors)
+    assert "error" in query_layer(layer, {"f": "pbf"}, options)
+    large = {"f": "json", "where": "OBJECTID BETWEEN 49 AND 50"}
+    assert "error" in query_layer(layer, large, options)
+    large = {"f": "json", "where": "OBJECTID BETWEEN 50 AND 50"}
+    assert len(query_layer(layer, large, options)["features"]) == 1
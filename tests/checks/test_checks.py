@@ -0,0 +1,40 @@
+import pytest
+from geopandas import GeoDataFrame
+
+from src.checks import __main__ as checks
+from src.checks import (
+    geometry_cache,
+    geometry_gaps,
+    geometry_overlaps_self,
+    geometry_valid,
+    geometry_within_parent,
+)
+
+GEOMETRY_CHECKS = [
+    geometry_valid,
+    geometry_gaps,
+    geometry_overlaps_self,
+    geometry_within_parent,
+]
+
+
+def test_run_checks_reuse(
+    gdfs: list[GeoDataFrame],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    tasks = [(x.main, checks.get_task_levels(x, 0)) for x in GEOMETRY_CHECKS]
+    geometry_cache.artifact_stats.clear()
+    for task in tasks:
+        checks.run_checks([task], "MDG", 0, {0: gdfs[0].copy()})
+    separate = geometry_cache.artifact_stats.copy()
+    layer = gdfs[0].copy()
+    monkeypatch.setattr(checks, "load_layer", lambda _, __: layer)
+    checks.read_layer.cache_clear()
+    geometry_cache.artifact_stats.clear()
+    results = checks.run_checks(tasks, "MDG", 0)
+    checks.read_layer.cache_clear()
+    assert [len(x) for x in results] == [1] * len(tasks)
+    stats = geometry_cache.artifact_stats
+    assert stats["misses"] == len(geometry_cache.artifacts[id(layer)])
+    assert stats["misses"] < separate["misses"]
+    assert stats["hits"] > separate["hits"]
@@ -0,0 +1,52 @@
+from geopandas import GeoDataFrame
+from shapely import box
+
+from src.checks import geometry_cache
+from src.config import EPSG_EQUAL_AREA, EPSG_WGS84
+
+
+def test_geometry_cache(gdfs: list[GeoDataFrame]) -> None:
+    gdf = gdfs[0]
+    projected = geometry_cache.get_projected(gdf, EPSG_EQUAL_AREA)
+    assert geometry_cache.get_projected(gdf, EPSG_EQUAL_AREA) is projected
+    assert geometry_cache.get_union(gdf) is geometry_cache.get_union(gdf)
+    assert tuple(geometry_cache.get_bounds(gdf)) == tuple(gdf.total_bounds)
+    copy = gdf.copy()
+    assert geometry_cache.get_projected(copy, EPSG_EQUAL_AREA) is not projected
+    key = id(copy)
+    del copy
+    assert key not in geometry_cache.artifacts
+
+
+def test_geometry_cache_dissolve() -> None:
+    cells = [(x, y) for x in range(6) for y in range(6) if (x, y) != (2, 3)]
+    gdf = GeoDataFrame(
+        {
+            "ADM0_PCODE": "AB",
+            "ADM1_PCODE": [f"AB{x // 3}" for x, _ in cells],
+            "ADM2_PCODE": [f"AB{x}{y}" for x, y in cells],
+        },
+        geometry=[box(x, y, x + 1, y + 1) for x, y in cells],
+        crs=EPSG_WGS84,
+    )
+    expected = gdf.geometry.union_all()
+    assert geometry_cache.is_coverage(gdf)
+    assert geometry_cache.dissolve(gdf).equals(expected)
+    assert geometry_cache.dissolve(gdf[["geometry"]]).equals(expected)
+    assert len(geometry_cache.get_union(gdf).interiors.iloc[0]) == 1
+
+
+def test_geometry_cache_not_coverage() -> None:
+    gdf = GeoDataFrame(
+        geometry=[box(0, 0, 2, 2), box(1, 1, 3, 3), None, box(5, 5, 6, 6)],
+        crs=EPSG_WGS84,
+    )
+    assert not geometry_cache.is_coverage(gdf)
+    is_invalid = geometry_cache.get_invalid_edges(gdf)
+    assert is_invalid.tolist() == [True, True, False, False]
+
+
+def test_geometry_cache_not_polygons() -> None:
+    gdf = GeoDataFrame(geometry=[box(0, 0, 1, 1).boundary], crs=EPSG_WGS84)
+    assert geometry_cache.get_invalid_edges(gdf) is None
+    assert not geometry_cache.is_coverage(gdf)
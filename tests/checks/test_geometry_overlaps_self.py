@@ -1,7 +1,10 @@
 import pytest
 from geopandas import GeoDataFrame
+from shapely import box
 
-from src.checks.geometry_overlaps_self import main
+from src.checks.geometry_cache import get_invalid_edges
+from src.checks.geometry_overlaps_self import get_overlaps_self, main
+from src.config import EPSG_EQUAL_AREA, EPSG_WGS84
 
 
 @pytest.mark.slow
@@ -12,26 +15,46 @@ def test_mdg_geometry_overlaps_self(iso3: str, gdfs: list[GeoDataFrame]) -> None
             "iso3": "MDG",
             "level": 0,
             "geom_overlaps_self": 0,
+            "geom_overlaps_self_area_km": 0,
         },
         {
             "iso3": "MDG",
             "level": 1,
             "geom_overlaps_self": 0,
+            "geom_overlaps_self_area_km": 0,
         },
         {
             "iso3": "MDG",
             "level": 2,
             "geom_overlaps_self": 0,
+            "geom_overlaps_self_area_km": 0,
         },
         {
             "iso3": "MDG",
             "level": 3,
             "geom_overlaps_self": 0,
+            "geom_overlaps_self_area_km": 0,
         },
         {
             "iso3": "MDG",
             "level": 4,
             "geom_overlaps_self": 0,
+            "geom_overlaps_self_area_km": 0,
         },
     ]
     assert actual == expected
+
+
+def test_geometry_overlaps_self_partial_coverage() -> None:
+    cells = [box(x, y, x + 1, y + 1) for x in range(4) for y in range(4)]
+    extra = [box(0.5, 0.5, 1.5, 1.5), box(2.5, 2.5, 5, 5), box(10, 10, 11, 11)]
+    gdf = GeoDataFrame(geometry=[*cells, *extra], crs=EPSG_WGS84)
+    joined = gdf.sjoin(gdf, predicate="overlaps")
+    overlap_count, overlap_area = get_overlaps_self(gdf)
+    assert overlap_count == len(joined) // 2
+    projected = gdf.to_crs(EPSG_EQUAL_AREA).geometry
+    left, right = joined.index, joined["index_right"]
+    pairs = left < right
+    expected = projected[left[pairs]].intersection(projected[right[pairs]], align=False)
+    assert overlap_area == pytest.approx(expected.area.sum())
+    assert get_invalid_edges(gdf).sum() < len(gdf)
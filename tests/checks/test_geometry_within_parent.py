@@ -1,7 +1,9 @@
 import pytest
 from geopandas import GeoDataFrame
+from shapely import box
 
 from src.checks.geometry_within_parent import main
+from src.config import EPSG_WGS84
 
 
 @pytest.mark.slow
@@ -39,3 +41,45 @@ def test_mdg_geometry_within_parent(iso3: str, gdfs: list[GeoDataFrame]) -> None
         },
     ]
     assert actual == expected
+
+
+def test_geometry_within_parent_pcode() -> None:
+    parent = GeoDataFrame(
+        {"ADM0_PCODE": ["AA", "AB", "AC", "AC"]},
+        geometry=[box(x, 0, x + 2, 2) for x in range(0, 8, 2)],
+        crs=EPSG_WGS84,
+    )
+    gdf = GeoDataFrame(
+        {
+            "ADM0_PCODE": ["AA", "AB", "AA", None, "ZZ", "AC", "AC", "AB", "AB"],
+            "ADM1_PCODE": [f"A{x}" for x in range(9)],
+        },
+        geometry=[
+            box(0, 0, 1, 1),
+            box(2, 0, 3, 1),
+            box(2, 1, 3, 2),
+            box(1, 1, 2, 2),
+            box(3, 1, 4, 2),
+            box(4, 0, 5, 1),
+            box(6, 1, 7, 2),
+            box(1, 0, 3, 1),
+            box(10, 0, 11, 1),
+        ],
+        crs=EPSG_WGS84,
+    )
+    within = gdf.sjoin(parent, predicate="within")
+    pcode = within["ADM0_PCODE_left"].eq(within["ADM0_PCODE_right"])
+    spatial = {
+        "iso3": "XAA",
+        "level": 1,
+        "geom_not_within_parent": len(gdf.index) - len(within.index),
+        "geom_not_within_pcode": len(within.index) - int(pcode.sum()),
+    }
+    expected = {
+        "iso3": "XAA",
+        "level": 1,
+        "geom_not_within_parent": 2,
+        "geom_not_within_pcode": 3,
+    }
+    assert spatial == expected
+    assert main("XAA", [parent, gdf])[1] == expected
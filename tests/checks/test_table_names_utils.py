@@ -0,0 +1,66 @@
+import pytest
+from langcodes import tag_is_valid
+from pandas import Series
+
+from src.checks.table_names_config import exclude_check, punctuation_set
+from src.checks.table_names_utils import check_chars, get_char_set
+
+NAMES = [
+    "Antananarivo",
+    "Antananarivo",
+    "Анталаха",
+    "Анта Nanarivo",
+    "Saint-Denis (Nord)",
+    "L'Île-Sainte-Marie",
+    "Ñuñoa, Región Metropolitana",
+    "\u0396eta 1",
+    "北京",
+    "台北 City",
+    "تونس",
+    "?!",
+    "...",
+    "",
+    "  ",
+    None,
+]
+
+COLUMNS = ["ADM1_EN", "ADM1_FR", "ADM1_RU", "ADM1_AR", "ADM1_ZH"]
+
+
+def get_invalid_chars(column: str, name: str | None, iso3: str) -> str:
+    lang = column.split("_")[1].lower()
+    if not name or not name.strip() or not tag_is_valid(lang) or lang in exclude_check:
+        return ""
+    char_set = list(get_char_set(lang, iso3))
+    return "".join({char for char in name if char not in char_set + punctuation_set})
+
+
+def is_punctuation(column: str, name: str | None, iso3: str) -> bool:
+    lang = column.split("_")[1].lower()
+    if not name or not name.strip() or not tag_is_valid(lang):
+        return False
+    char_set = list(get_char_set(lang, iso3))
+    return all(char not in char_set for char in name)
+
+
+def is_invalid(column: str, name: str | None, iso3: str) -> bool:
+    lang = column.split("_")[1].lower()
+    if not name or not name.strip() or not tag_is_valid(lang) or lang in exclude_check:
+        return False
+    char_set = list(get_char_set(lang, iso3))
+    return any(char not in char_set + punctuation_set for char in name)
+
+
+@pytest.mark.parametrize(
+    "column",
+    ["ADM1_EN", "ADM1_FR", "ADM1_RU", "ADM1_AR", "ADM1_ZH"],
+)
+@pytest.mark.parametrize("iso3", ["MDG", "TUN"])
+def test_check_chars(column: str, iso3: str) -> None:
+    names = Series(NAMES, dtype=object)
+    expected = (
+        set(names.map(lambda x: get_invalid_chars(column, x, iso3)).sum()),
+        names.map(lambda x: is_punctuation(column, x, iso3)).sum(),
+        names.map(lambda x: is_invalid(column, x, iso3)).sum(),
+    )
+    assert check_chars(column, names, iso3) == expected
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import pytest
+from geopandas import GeoDataFrame
+from shapely import box
+
+from src.download import checkpoint
+
+STATE = {"url": "https://x/FeatureServer", "idx": 1, "last_edit_date": 1, "count": 25}
+
+
+@pytest.fixture(autouse=True)
+def boundaries_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(checkpoint, "boundaries_dir", tmp_path)
+    return tmp_path
+
+
+def test_checkpoint_pages() -> None:
+    assert not checkpoint.exists("abc_adm1")
+    checkpoint.load_checkpoint("abc_adm1", STATE)
+    assert checkpoint.exists("abc_adm1")
+    checkpoint.save_page("abc_adm1", 10, 5, "json", b"{}")
+    assert checkpoint.load_page("abc_adm1", 10, "json") == (5, b"{}")
+    assert checkpoint.load_page("abc_adm1", 10, "pbf") is None
+    assert checkpoint.load_page("abc_adm1", 0, "json") is None
+    checkpoint.clear("abc_adm1")
+    assert not checkpoint.exists("abc_adm1")
+    assert checkpoint.load_page("abc_adm1", 10, "json") is None
+
+
+def test_checkpoint_offset() -> None:
+    offset = 20
+    checkpoint.load_checkpoint("abc_adm1", STATE)
+    assert checkpoint.get_offset("abc_adm1") == 0
+    gdf = GeoDataFrame(geometry=[box(x, 0, x + 1, 1) for x in range(offset)], crs=4326)
+    gdf.to_file(checkpoint.get_partial_file("abc_adm1"), layer="abc_adm1")
+    checkpoint.load_checkpoint("abc_adm1", STATE)
+    assert checkpoint.get_offset("abc_adm1") == offset
+    checkpoint.load_checkpoint("abc_adm1", {**STATE, "count": 30})
+    assert checkpoint.get_offset("abc_adm1") == 0
+    assert not checkpoint.get_partial_file("abc_adm1").is_file()
+
+
+def test_checkpoint_edited() -> None:
+    checkpoint.load_checkpoint("abc_adm1", STATE)
+    checkpoint.save_page("abc_adm1", 0, 20, "json", b"{}")
+    edited = {**STATE, "last_edit_date": 2}
+    checkpoint.load_checkpoint("abc_adm1", edited)
+    assert checkpoint.exists("abc_adm1")
+    assert checkpoint.load_page("abc_adm1", 0, "json") is None
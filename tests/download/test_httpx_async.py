@@ -0,0 +1,209 @@
+from asyncio import run
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+import pytest
+from geopandas import read_file
+from pandas import Series
+
+from src import cache
+from src.benchmark.server import query_layer, read_layer, start_server
+from src.config import PAGE_RECORDS_MAX
+from src.download import checkpoint, httpx, manifest, stats
+from src.download.httpx import read_ids, read_page
+from src.download.httpx_async import (
+    download_all,
+    download_json,
+    download_pbf,
+    download_stream,
+    iter_pages,
+)
+from src.utils import close_async_client
+
+
+@pytest.fixture(scope="module")
+def layer() -> dict[str, Any]:
+    return read_layer(Path("tests/test_data/mdg_adm0.gpkg"))
+
+
+def get_features(options: dict[str, Any], offsets: range | Series) -> list[int]:
+    async def collect() -> list[int]:
+        url = f"{options['url']}/XAA/FeatureServer"
+        read = partial(read_page, fmt="json")
+        try:
+            return [
+                feature["attributes"]["OBJECTID"]
+                async for page in iter_pages(url, 0, offsets, read)
+                for feature in page["features"]
+            ]
+        finally:
+            await close_async_client()
+
+    return run(collect())
+
+
+def test_iter_pages_errors(layer: dict[str, Any]) -> None:
+    server, options = start_server({"XAA": {0: layer}}, error_records=3)
+    count = len(layer["features"])
+    try:
+        assert get_features(options, range(count)) == list(range(1, count + 1))
+    finally:
+        server.shutdown()
+    fixed_fallback = len([1000, 100, 10]) + count
+    assert options["requests"] < fixed_fallback
+
+
+def test_iter_pages_max_record_count(layer: dict[str, Any]) -> None:
+    server, options = start_server({"XAA": {0: layer}}, max_record_count=5)
+    count = len(layer["features"])
+    try:
+        assert get_features(options, range(count)) == list(range(1, count + 1))
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.parametrize(
+    ("max_record_count", "error_records"),
+    [(5, 0), (2000, 3)],
+)
+def test_iter_pages_object_ids(
+    layer: dict[str, Any],
+    max_record_count: int,
+    error_records: int,
+) -> None:
+    features = [x for x in layer["features"] if x["attributes"]["OBJECTID"] % 3]
+    gaps = {**layer, "features": features}
+    server, options = start_server(
+        {"XAA": {0: gaps}},
+        error_records=error_records,
+        max_record_count=max_record_count,
+    )
+    ids = read_ids(query_layer(gaps, {"returnIdsOnly": "true"}, options))
+    try:
+        assert get_features(options, ids) == ids.tolist()
+    finally:
+        server.shutdown()
+
+
+def test_iter_pages_large_geometry() -> None:
+    count = 50_000
+    ring = [[0, 0], [0, 1], [1, 1], [0, 0]]
+    features = [
+        {"attributes": {"OBJECTID": x + 1}, "geometry": {"rings": [ring]}}
+        for x in range(count)
+    ]
+    layer = {"fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}]}
+    layer["features"] = features
+    server, options = start_server({"XAA": {0: layer}}, error_ids={101})
+    try:
+        assert get_features(options, range(count)) == list(range(1, count + 1))
+    finally:
+        server.shutdown()
+    pages = count // PAGE_RECORDS_MAX
+    assert options["requests"] < 2 * pages
+
+
+def test_download_stream_resume(
+    layer: dict[str, Any],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(checkpoint, "boundaries_dir", tmp_path)
+    monkeypatch.setattr(httpx, "boundaries_dir", tmp_path)
+    server, options = start_server({"XAA": {0: layer}}, max_record_count=5)
+    url = f"{options['url']}/XAA/FeatureServer"
+    count = len(layer["features"])
+    state = {"url": url, "idx": 0, "last_edit_date": 1, "count": count}
+
+    async def download() -> None:
+        try:
+            await download_stream("XAA", 0, 0, url, state)
+        finally:
+            await close_async_client()
+
+    try:
+        run(download())
+        full = options["requests"]
+        written = read_file(tmp_path / "xaa_adm0.gpkg").iloc[:12]
+        written.to_file(checkpoint.get_partial_file("xaa_adm0"), layer="xaa_adm0")
+        checkpoint.load_checkpoint("xaa_adm0", state)
+        run(download())
+    finally:
+        server.shutdown()
+    gdf = read_file(tmp_path / "xaa_adm0.gpkg")
+    assert len(gdf) == count
+    assert not gdf.geometry.to_wkb().duplicated().any()
+    assert options["requests"] - full < full
+    assert [x.name for x in tmp_path.iterdir()] == ["xaa_adm0.gpkg"]
+
+
+def test_download_pbf_unsupported(layer: dict[str, Any]) -> None:
+    server, options = start_server({"XAA": {0: layer}})
+    url = f"{options['url']}/XAA/FeatureServer"
+    try:
+        state = manifest.get_state(url, 0)
+        requests = options["requests"]
+        assert not state["pbf"]
+        assert not run(download_pbf("XAA", 0, 0, url, state))
+    finally:
+        server.shutdown()
+    assert options["requests"] == requests
+
+
+def test_download_json_empty(layer: dict[str, Any]) -> None:
+    empty = {**layer, "features": []}
+    server, options = start_server({"XAA": {0: empty}}, error_rate=100)
+    url = f"{options['url']}/XAA/FeatureServer"
+    state = {"url": url, "idx": 0, "last_edit_date": 1, "count": 0}
+
+    async def download() -> None:
+        try:
+            await download_json("XAA", 0, 0, url, state)
+        finally:
+            await close_async_client()
+
+    try:
+        with pytest.raises(RuntimeError, match="xaa_adm0"):
+            run(download())
+    finally:
+        server.shutdown()
+
+
+def test_download_all_edited(
+    layer: dict[str, Any],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    for module in [checkpoint, httpx, manifest]:
+        monkeypatch.setattr(module, "boundaries_dir", tmp_path)
+    monkeypatch.setattr(stats, "tables_dir", tmp_path)
+    monkeypatch.setattr(cache, "cache_dir", tmp_path / "cache")
+    monkeypatch.setattr(cache, "HTTP_CACHE", True)
+    monkeypatch.setattr(cache, "HTTP_CACHE_OFFLINE", False)
+    monkeypatch.setattr(cache, "size", {})
+    (tmp_path / "cache").mkdir()
+    layers = {"XAA": {0: layer}}
+    server, options = start_server(layers)
+    metadata = [
+        {
+            "iso3": "XAA",
+            "admin_level": 0,
+            "itos_url": f"{options['url']}/XAA/FeatureServer",
+            "itos_index_0": 0,
+        },
+    ]
+    features = [
+        {**x, "attributes": {**x["attributes"], "ADM0_EN": "Edited"}}
+        for x in layer["features"]
+    ]
+    try:
+        run(download_all(metadata))
+        edit = layer["last_edit_date"] + 1
+        layers["XAA"][0] = {**layer, "features": features, "last_edit_date": edit}
+        run(download_all(metadata))
+    finally:
+        server.shutdown()
+    gdf = read_file(tmp_path / "xaa_adm0.gpkg")
+    assert len(gdf) == len(features)
+    assert (gdf["ADM0_EN"] == "Edited").all()
@@ -0,0 +1,87 @@
+from struct import pack
+
+from shapely import MultiPolygon, Polygon
+
+from src.download.pbf import read_pbf
+
+
+def varint(value: int) -> bytes:
+    result = b""
+    while value >> 7:
+        result += bytes([(value & 0x7F) | 0x80])
+        value >>= 7
+    return result + bytes([value])
+
+
+def zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def field(number: int, value: bytes | int) -> bytes:
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def double(number: int, value: float) -> bytes:
+    return varint(number << 3 | 1) + pack("<d", value)
+
+
+def geometry(rings: list[list[tuple[int, int]]]) -> bytes:
+    coords = []
+    last_x, last_y = 0, 0
+    for ring in rings:
+        for x, y in ring:
+            coords += [zigzag(x - last_x), zigzag(y - last_y)]
+            last_x, last_y = x, y
+    lengths = b"".join(varint(len(ring)) for ring in rings)
+    return field(2, lengths) + field(3, b"".join(varint(x) for x in coords))
+
+
+def feature(oid: int, name: str | None, rings: list[list[tuple[int, int]]]) -> bytes:
+    name_value = field(1, name.encode()) if name is not None else b""
+    attributes = field(1, field(5, oid)) + field(1, name_value)
+    return attributes + field(2, geometry(rings))
+
+
+def collection(*features: bytes, exceeded: bool = False) -> bytes:
+    fields = field(13, field(1, b"OBJECTID") + field(2, 6)) + field(
+        13,
+        field(1, b"ADM1_EN") + field(2, 4),
+    )
+    transform = field(
+        12,
+        field(1, 1)
+        + field(2, double(1, 0.5) + double(2, 0.5))
+        + field(3, double(1, 10.0) + double(2, 20.0)),
+    )
+    result = (
+        field(8, field(1, 4326))
+        + field(9, int(exceeded))
+        + transform
+        + fields
+        + b"".join(field(15, x) for x in features)
+    )
+    return field(2, field(1, result))
+
+
+def test_read_pbf() -> None:
+    square = [(0, 0), (0, 4), (4, 4), (4, 0), (0, 0)]
+    hole = [(1, 1), (3, 1), (3, 3), (1, 3), (1, 1)]
+    other = [(10, 0), (10, 2), (12, 2), (12, 0), (10, 0)]
+    content = collection(
+        feature(1, "North", [square, hole]),
+        feature(2, None, [square, other]),
+        exceeded=True,
+    )
+    gdf, exceeded = read_pbf(content)
+    assert exceeded
+    assert gdf.crs == "EPSG:4326"
+    assert gdf["OBJECTID"].tolist() == [1, 2]
+    assert gdf["ADM1_EN"][0] == "North"
+    assert gdf["ADM1_EN"].isna()[1]
+    shell = [(10, 20), (10, 22), (12, 22), (12, 20), (10, 20)]
+    inner = [(10.5, 20.5), (11.5, 20.5), (11.5, 21.5), (10.5, 21.5), (10.5, 20.5)]
+    assert gdf.geometry[0].equals(Polygon(shell, [inner]))
+    island = [(15, 20), (15, 21), (16, 21), (16, 20), (15, 20)]
+    assert gdf.geometry[1].equals(MultiPolygon([Polygon(shell), Polygon(island)]))
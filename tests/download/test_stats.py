@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from httpx import Response
+
+from src.download import stats
+
+
+def test_layer_stats() -> None:
+    page_sizes = [10, 5]
+
+    def download() -> dict:
+        layer_stats = stats.start_layer("ABC", 1)
+        with ThreadPoolExecutor(2) as executor:
+            for records in page_sizes:
+                executor.submit(copy_context().run, stats.record_page, records)
+        stats.record_page_error()
+        stats.record_retry(None)
+        stats.record_response(Response(200, content=b"{}"))
+        return stats.finish_layer(layer_stats, "downloaded")
+
+    layer_stats = copy_context().run(download)
+    assert layer_stats["pages"] == len(page_sizes)
+    assert layer_stats["page_errors"] == 1
+    assert layer_stats["retries"] == 1
+    assert layer_stats["requests"] == 1
+    assert layer_stats["latency_seconds"] > 0
+    assert "start" not in layer_stats
+    assert stats.layer_stats.get() is None
@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from os import utime
+from pathlib import Path
+
+import pytest
+from httpx import Request, Response
+
+from src import cache
+
+URL = "https://example.com/FeatureServer/0"
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(cache, "cache_dir", tmp_path)
+    monkeypatch.setattr(cache, "HTTP_CACHE", True)
+    monkeypatch.setattr(cache, "HTTP_CACHE_OFFLINE", False)
+    monkeypatch.setattr(cache, "size", {})
+    return tmp_path
+
+
+def get_response(content: bytes, status: int = 200) -> Response:
+    return Response(
+        status,
+        headers={"etag": '"abc"', "content-type": "application/json"},
+        content=content,
+        request=Request("GET", URL),
+    )
+
+
+def test_cache_revalidate(monkeypatch: pytest.MonkeyPatch) -> None:
+    params = {"f": "json", "where": "1=1"}
+    key, entry, cached = cache.get_cached(URL, params)
+    assert entry is None
+    assert cached is None
+    response = cache.update(key, entry, get_response(b"{}"))
+    assert response.content == b"{}"
+    assert cache.get_cached(URL, dict(reversed(params.items())))[2].content == b"{}"
+    monkeypatch.setattr(cache, "HTTP_CACHE_TTL", 0)
+    key, entry, cached = cache.get_cached(URL, params)
+    assert cached is None
+    assert cache.get_headers(entry) == {"If-None-Match": '"abc"'}
+    response = cache.update(key, entry, get_response(b"", 304))
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"{}"
+
+
+def test_cache_errors_not_saved() -> None:
+    key, entry, _ = cache.get_cached(URL)
+    cache.update(key, entry, get_response(b'{"error":{"code":500}}'))
+    cache.update(key, entry, get_response(b'{\n  "error" : {"code": 500}}'))
+    cache.update(key, entry, get_response(b"", 500))
+    assert cache.load_response(key) is None
+
+
+def test_cache_concurrent_saves(cache_dir: Path) -> None:
+    key, entry, _ = cache.get_cached(URL)
+    responses = [get_response(str(x).encode()) for x in range(50)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(partial(cache.update, key, entry), responses))
+    assert cache.load_response(key) is not None
+    assert not list(cache_dir.glob("*.tmp"))
+
+
+def test_cache_offline(monkeypatch: pytest.MonkeyPatch) -> None:
+    key, entry, _ = cache.get_cached(URL)
+    cache.update(key, entry, get_response(b"{}"))
+    monkeypatch.setattr(cache, "HTTP_CACHE_OFFLINE", True)
+    monkeypatch.setattr(cache, "HTTP_CACHE_TTL", 0)
+    assert cache.get_cached(URL)[2].content == b"{}"
+    with pytest.raises(FileNotFoundError, match="query"):
+        cache.get_cached(f"{URL}/query")
+
+
+def test_cache_bypassed() -> None:
+    key, entry, _ = cache.get_cached(URL)
+    cache.update(key, entry, get_response(b"{}"))
+    with cache.bypassed():
+        assert cache.get_cached(URL) == ("", None, None)
+        cache.update("", None, get_response(b"[]"))
+    assert cache.get_cached(URL)[2].content == b"{}"
+
+
+def test_cache_versioned() -> None:
+    with cache.versioned(1):
+        key, entry, _ = cache.get_cached(URL)
+        cache.update(key, entry, get_response(b"{}"))
+        assert cache.get_cached(URL)[2].content == b"{}"
+    with cache.versioned(2):
+        assert cache.get_cached(URL)[2] is None
+    assert cache.get_cached(URL)[2] is None
+
+
+def test_cache_evict(monkeypatch: pytest.MonkeyPatch) -> None:
+    old_key, entry, _ = cache.get_cached(URL)
+    cache.update(old_key, entry, get_response(b"{}"))
+    old_file, _ = cache.get_files(old_key)
+    utime(old_file, (0, 0))
+    size = sum(x.stat().st_size for x in cache.get_files(old_key))
+    monkeypatch.setattr(cache, "BYTES_PER_MB", 1)
+    monkeypatch.setattr(cache, "HTTP_CACHE_SIZE_MB", size * 3 // 2)
+    new_key, entry, _ = cache.get_cached(f"{URL}/query")
+    cache.update(new_key, entry, get_response(b"{}"))
+    assert cache.load_response(old_key) is None
+    assert cache.load_response(new_key) is not None
+
+
+def test_cache_evict_running_total(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+    monkeypatch.setattr(cache, "evict", lambda: calls.append(1))
+    for i in range(5):
+        key, entry, _ = cache.get_cached(f"{URL}/{i}")
+        cache.update(key, entry, get_response(b"{}"))
+    assert calls == []
+    total = sum(x.stat().st_size for x in cache.cache_dir.iterdir())
+    assert cache.size["bytes"] == total